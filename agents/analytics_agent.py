@@ -1,19 +1,112 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts import db_operations
-import json
-import streamlit as st
+from scripts.archive import fetch_fitness_history
+import copy
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+import numpy as np
+import pandas as pd
+from scripts.cache import TTLCache
+
+# Daily targets used for goal attainment (share of days at or above target).
+DEFAULT_GOALS = {"steps": 5000, "calories": 2000, "sleep": 7.0}
+PERCENTILES = (0.1, 0.5, 0.9)
+
+# Results per (database, user, window start, goals), each stored with the
+# user's fitness data version; see get_analytics.
+ANALYTICS_CACHE_SIZE = 1024
+_analytics_cache = TTLCache(maxsize=ANALYTICS_CACHE_SIZE)
+
+
+def _to_frame(data) -> pd.DataFrame:
+    """Accept a DataFrame or the list-of-dicts shape the old helpers took."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame(list(data or []))
+
+
+def _trend_slopes(days: np.ndarray, values: pd.DataFrame) -> pd.Series:
+    """
+    Least-squares slope (units per day) for every column at once, ignoring
+    missing values column by column.
+    """
+    y = values.to_numpy(dtype=float)
+    mask = ~np.isnan(y)
+    n = mask.sum(axis=0)
+    x = np.where(mask, days[:, None], 0.0)
+    x_mean = x.sum(axis=0) / np.maximum(n, 1)
+    y_mean = np.where(mask, y, 0.0).sum(axis=0) / np.maximum(n, 1)
+    xc = np.where(mask, days[:, None] - x_mean, 0.0)
+    yc = np.where(mask, y - y_mean, 0.0)
+    denom = (xc ** 2).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.where((n >= 2) & (denom > 0), (xc * yc).sum(axis=0) / denom, np.nan)
+    return pd.Series(slope, index=values.columns)
+
+
+def compute_fitness_analytics(data, goals: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Summarise a fitness history (DataFrame with a "date" column, or list of
+    dicts) for every metric in one vectorized pass: mean, percentiles, min/max,
+    latest 7- and 30-day rolling means, trend slope per day and goal attainment.
+    """
+    goals = DEFAULT_GOALS if goals is None else goals
+    df = _to_frame(data)
+    metrics = [m for m in db_operations.FITNESS_METRICS if m in df.columns]
+    result: Dict[str, Any] = {"days": int(len(df)), "metrics": {}, "goals": {}}
+    if df.empty or not metrics:
+        return result
+
+    values = df[metrics].apply(pd.to_numeric, errors="coerce")
+    dates = pd.to_datetime(df["date"], errors="coerce") if "date" in df else pd.Series(pd.NaT, index=df.index)
+    has_dates = dates.notna().all()
+
+    quantiles = values.quantile(list(PERCENTILES))
+    summary = values.agg(["mean", "min", "max", "count"])
+
+    if has_dates:
+        order = dates.argsort(kind="stable")
+        timed = values.iloc[order].set_index(dates.iloc[order])
+        rolling_7 = timed.rolling("7D").mean().iloc[-1]
+        rolling_30 = timed.rolling("30D").mean().iloc[-1]
+        day_numbers = ((dates - dates.min()).dt.days).to_numpy(dtype=float)
+        result["start"] = dates.min().strftime("%Y-%m-%d")
+        result["end"] = dates.max().strftime("%Y-%m-%d")
+    else:
+        rolling_7 = values.tail(7).mean()
+        rolling_30 = values.tail(30).mean()
+        day_numbers = np.arange(len(values), dtype=float)
+    slopes = _trend_slopes(day_numbers, values)
+
+    for m in metrics:
+        result["metrics"][m] = {
+            "mean": float(summary.at["mean", m]),
+            "min": float(summary.at["min", m]),
+            "max": float(summary.at["max", m]),
+            "count": int(summary.at["count", m]),
+            **{f"p{int(q * 100)}": float(quantiles.at[q, m]) for q in PERCENTILES},
+            "rolling_7d": float(rolling_7[m]),
+            "rolling_30d": float(rolling_30[m]),
+            "trend_per_day": float(slopes[m]),
+        }
+
+    targets = {m: t for m, t in goals.items() if m in metrics}
+    if targets:
+        hit = values[list(targets)].ge(pd.Series(targets)).where(values[list(targets)].notna())
+        attainment = hit.mean()
+        for m, target in targets.items():
+            result["goals"][m] = {"target": target, "attainment": float(attainment[m])}
+    return result
+
 
 def cal_avg_steps(data):
-    if not data:
+    df = _to_frame(data)
+    if df.empty:
         return 0
-    total_steps = sum(entry['steps'] for entry in data)
-    return total_steps/len(data)
+    return float(pd.to_numeric(df["steps"]).mean())
 
-def analyse_calories(data, target=2000):
-    if not data:
-        return "No data available."
-    avg_calories = sum(entry['calories'] for entry in data)/len(data)
+def _calories_status(avg_calories, target):
     if avg_calories > target:
         return "Above target"
     elif avg_calories < target:
@@ -21,46 +114,73 @@ def analyse_calories(data, target=2000):
     else:
         return "On track"
 
-def classify_heart_rate(data):
-    if not data:
+def analyse_calories(data, target=2000):
+    df = _to_frame(data)
+    if df.empty:
         return "No data available."
-    avg_hr = sum(entry['heart_rate'] for entry in data)/len(data)
+    return _calories_status(float(pd.to_numeric(df["calories"]).mean()), target)
+
+def _heart_rate_status(avg_hr):
     if avg_hr < 60:
         return "Low"
     elif 60 <= avg_hr <= 100:
         return "Normal"
     else:
         return "High"
-    
-@st.cache_data(ttl=300) # Cache the result for 300 seconds (5 minutes)
-def get_analytics():
+
+def classify_heart_rate(data):
+    df = _to_frame(data)
+    if df.empty:
+        return "No data available."
+    return _heart_rate_status(float(pd.to_numeric(df["heart_rate"]).mean()))
+
+def clear_analytics_cache():
+    _analytics_cache.clear()
+
+def analytics_cache_stats() -> Dict[str, int]:
+    return _analytics_cache.stats()
+
+def get_analytics(user_id: int, window_days: Optional[int] = None, goals: Optional[Dict[str, float]] = None):
     """
-    Fetches raw fitness data, calculates metrics, and returns insights.
-    The @st.cache_data decorator ensures this intensive computation only runs once 
-    every 5 minutes or if the database file (a dependency) changes.
+    Analytics for one user's fitness history: the full history (SQLite plus
+    Parquet archive) or just the last `window_days` days.
+    Returns compute_fitness_analytics() output, the running stats under
+    "online" (db_operations.fetch_online_stats), the window's anomaly events
+    under "anomalies" (db_operations.fetch_anomalies) and the summary keys the UI and
+    chatbot have always used: average_steps, calories_vs_target, heart_rate_status.
+
+    Cached per user and window. An entry is reused only while the user's
+    fitness data version (db_operations.get_fitness_version, bumped by every
+    fitness write) is unchanged, so a read right after a save is never stale
+    and other users' entries are untouched.
     """
-    # ... (Keep existing logic)
-    # data = db_operations.fetch_fitness()  <-- This line should be here, assumed working
-    
-    # Since we don't have the content of db_operations, we will ensure that 
-    # db_operations.fetch_fitness() is either mocked or assumed to work with caching.
-    
-    # NOTE: Assuming fetch_fitness is called here and returns data
-    # We must ensure all inputs to this function are hashable for caching to work.
-
-    # ----------------------------------------------------
-    # MOCK DATA FOR DEMONSTRATION (If the real DB fetch is slow/unreliable)
-    # To truly test speed, you'd use a real fetch_fitness() call here.
-    
-    # Since this is a performance task, we assume the real db_operations is called here:
-    data = db_operations.fetch_fitness() 
-    
-    if isinstance(data, dict):
-        data = [data]
-    
-    insights = {
-        "average_steps": cal_avg_steps(data),
-        "calories_vs_target": analyse_calories(data),
-        "heart_rate_status": classify_heart_rate(data)
-    }
-    return insights
\ No newline at end of file
+    start = (date.today() - timedelta(days=window_days)).isoformat() if window_days else None
+    key = (db_operations.DB_NAME, user_id, start, tuple(sorted((goals or {}).items())))
+    version = db_operations.get_fitness_version(user_id)
+    cached = _analytics_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return copy.deepcopy(cached[1])
+
+    insights = _compute_analytics(user_id, start, goals)
+    _analytics_cache.set(key, (version, insights))
+    return copy.deepcopy(insights)
+
+def _compute_analytics(user_id: int, start: Optional[str], goals: Optional[Dict[str, float]]):
+    data = fetch_fitness_history(user_id, start=start)
+
+    insights = compute_fitness_analytics(data, goals=goals)
+    insights["user_id"] = user_id
+    # Running mean / std / z-score per vital, maintained on ingest
+    insights["online"] = db_operations.fetch_online_stats(user_id)
+    insights["anomalies"] = db_operations.fetch_anomalies(user_id, start=start)
+    metrics = insights["metrics"]
+    if metrics:
+        insights["average_steps"] = metrics["steps"]["mean"]
+        calories_target = (goals or DEFAULT_GOALS).get("calories", 2000)
+        insights["calories_vs_target"] = _calories_status(metrics["calories"]["mean"], calories_target)
+        insights["heart_rate_status"] = _heart_rate_status(metrics["heart_rate"]["mean"])
+    else:
+        insights["average_steps"] = 0
+        insights["calories_vs_target"] = "No data available."
+        insights["heart_rate_status"] = "No data available."
+    return insights
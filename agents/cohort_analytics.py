@@ -0,0 +1,90 @@
+# agents/cohort_analytics.py
+"""
+Panel-level analytics for a doctor: every patient's recent averages, where
+they sit in the panel's distribution, who is an outlier and who is at risk.
+
+The per-patient numbers come from one grouped query over the daily rollups
+(db_operations.fetch_panel_fitness_stats); everything after that is column-wise
+pandas / numpy work, so the cost does not grow with a Python loop per patient.
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from scripts import db_operations
+from agents.risk_ml import RISK_LEVELS, predict_risk_levels
+
+COHORT_METRICS = ("steps", "heart_rate", "bp", "sleep")
+DEFAULT_WINDOW_DAYS = 30
+DISTRIBUTION_PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+# Tukey fences: outside [Q1 - k*IQR, Q3 + k*IQR] of the panel's patient means
+OUTLIER_IQR_K = 1.5
+NO_DATA = "No data"
+
+
+def summarise_cohort(patients: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Post-process fetch_panel_fitness_stats() output.
+    Returns {"patients": per-patient DataFrame with risk_level, outliers and
+    outlier_count added, sorted for triage (highest risk and most outliers
+    first); "distribution": one row per metric (count, mean, std, min,
+    percentiles, max) over patient means; "risk_counts": {level: n};
+    "outliers": long DataFrame of (id, name, metric, value, direction)}.
+    """
+    patients = patients.reset_index(drop=True)
+    means = patients[[f"{m}_mean" for m in COHORT_METRICS]]
+    means.columns = list(COHORT_METRICS)
+
+    distribution = means.describe(percentiles=list(DISTRIBUTION_PERCENTILES)).T
+    distribution.index.name = "metric"
+
+    q1, q3 = means.quantile(0.25), means.quantile(0.75)
+    spread = OUTLIER_IQR_K * (q3 - q1)
+    low, high = means.lt(q1 - spread), means.gt(q3 + spread)
+    patients["outlier_count"] = (low | high).sum(axis=1)
+
+    flagged = means.where(low | high).stack()
+    rows = flagged.index.get_level_values(0)
+    outliers = pd.DataFrame({
+        "id": patients["id"].to_numpy()[rows],
+        "name": patients["name"].to_numpy()[rows],
+        "metric": flagged.index.get_level_values(1),
+        "value": flagged.to_numpy(),
+        "direction": np.where(high.stack().loc[flagged.index].to_numpy(), "high", "low"),
+    })
+    labels = (outliers["metric"] + " " + outliers["direction"]).groupby(rows).agg(", ".join)
+    patients["outliers"] = labels.reindex(patients.index, fill_value="")
+
+    has_data = patients["latest_date"].notna()
+    patients["risk_level"] = np.where(
+        has_data, predict_risk_levels(patients["latest_steps"], patients["latest_heart_rate"]), NO_DATA
+    )
+    levels = list(RISK_LEVELS) + [NO_DATA]
+    risk_counts = patients["risk_level"].value_counts().reindex(levels, fill_value=0)
+
+    rank = patients["risk_level"].map({level: i for i, level in enumerate(levels)})
+    patients = (patients.assign(_rank=rank)
+                .sort_values(["_rank", "outlier_count", "name"], ascending=[True, False, True], kind="stable")
+                .drop(columns="_rank").reset_index(drop=True))
+    return {
+        "patients": patients,
+        "distribution": distribution,
+        "risk_counts": {level: int(n) for level, n in risk_counts.items()},
+        "outliers": outliers,
+    }
+
+
+def cohort_analytics(doctor_user_id: int, window_days: Optional[int] = DEFAULT_WINDOW_DAYS) -> Dict[str, Any]:
+    """
+    Triage view of a doctor's whole panel over the last `window_days` days
+    (None = all history). See summarise_cohort() for the shape.
+    """
+    start = (date.today() - timedelta(days=window_days)).isoformat() if window_days else None
+    patients = db_operations.fetch_panel_fitness_stats(doctor_user_id, start=start, metrics=COHORT_METRICS)
+    result = summarise_cohort(patients)
+    result["window_start"] = start
+    return result
@@ -1,6 +1,5 @@
 # agents/health_chatbot.py
 
-import sqlite3
 import os
 import sys
 import time
@@ -16,10 +15,9 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # Initialize the client
 client = Groq(api_key=GROQ_API_KEY)
 
-# Resolve database path
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
-DB_PATH = os.path.join(PROJECT_ROOT, "health_data.db")
+# Medication data comes from the shared app database (scripts/db_operations)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import db_operations
 
 # Small cache (optional)
 CHATBOT_CACHE = {}
@@ -31,20 +29,11 @@ CACHE_TTL = 30   # 30 seconds
 # ------------------------------
 def get_medication_info_from_db(search_term: str) -> str | None:
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT med_name, schedule, notes
-            FROM medications
-            WHERE LOWER(med_name) LIKE ?
-        """, (f"%{search_term.lower()}%",))
-
-        row = cursor.fetchone()
-        if not row:
+        rows = db_operations.search_medications(search_term)
+        if not rows:
             return None
 
-        med, schedule, notes = row
+        med, schedule, notes = rows[0]
         return (
             f"Medication: **{med}**\n"
             f"Schedule: **{schedule}**\n"
@@ -53,9 +42,6 @@ def get_medication_info_from_db(search_term: str) -> str | None:
 
     except Exception as e:
         return f"Error reading medication data: {e}"
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 # ------------------------------
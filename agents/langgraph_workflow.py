@@ -1,7 +1,7 @@
 # agents/langgraph_workflow.py
-from scripts.db_operations import fetch_medications, fetch_fitness
+from scripts.db_operations import fetch_medications, fetch_fitness, fetch_online_stats
 from agents.interaction_checker import check_med_interaction
-from agents.risk_ml import predict_risk  # rule-based in your repo
+from agents.risk_engine import get_risk_engine  # backends chosen by RISK_BACKENDS
 from agents.report_generator import build_report
 
 
@@ -23,8 +23,9 @@ class HealthWorkflow:
         return check_med_interaction(medications)
 
     def compute_risk(self, fitness):
-        # fitness expected dict with steps, calories, heart_rate
-        return predict_risk(fitness)
+        # fitness expected dict as returned by fetch_fitness;
+        # the running per-user stats let the engine spot personal outliers
+        return get_risk_engine().predict(fitness, baseline=fetch_online_stats(self.user_id))
 
     def run(self):
         data = self.fetch()
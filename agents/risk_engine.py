@@ -0,0 +1,204 @@
+# agents/risk_engine.py
+"""
+One entry point for patient risk scoring, whichever model does the work.
+
+A RiskEngine runs an ordered list of backends and answers with the first
+one that is available and does not fail:
+
+    rules    agents.risk_ml thresholds on steps / heart rate (always available)
+    forest   the trained RandomForest on all 7 vitals (models/predict.py);
+             unavailable when the model files are missing
+
+Both read the same features, extracted from a fetch_fitness()-style dict or
+a fitness_data-shaped DataFrame by extract_features() / extract_feature_frame()
+(columns FEATURE_COLUMNS, models.registry.FITNESS_FEATURES mapping);
+predict_users() reads them precomputed from the feature store. The
+per-user baseline check (risk_ml.apply_baseline) is applied on top of any
+backend's answer.
+
+Pick the backends per deployment with RISK_BACKENDS (comma separated, in
+fallback order), e.g. RISK_BACKENDS=forest,rules. stats() reports calls,
+rows, errors and latency per backend to compare them. New backends subclass
+RiskBackend and are added to BACKENDS.
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import logging
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from agents import risk_ml
+from models import registry
+
+# fitness_data columns the backends read, in the model's FEATURES order
+FEATURE_COLUMNS = tuple(registry.FITNESS_FEATURES[f] for f in registry.FEATURES)
+DEFAULT_BACKENDS = tuple(b.strip() for b in os.getenv("RISK_BACKENDS", "rules").split(",") if b.strip())
+
+logger = logging.getLogger(__name__)
+
+
+def extract_features(fitness: Mapping[str, Any]) -> Dict[str, float]:
+    """FEATURE_COLUMNS values of a fetch_fitness() dict as floats; missing or None count as 0."""
+    return {c: float(fitness.get(c) or 0) for c in FEATURE_COLUMNS}
+
+
+def extract_feature_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    FEATURE_COLUMNS of a fitness_data-shaped frame (or one with the model's
+    feature names, e.g. db_operations.fetch_risk_features()) as floats;
+    missing columns / NaN count as 0.
+    """
+    if set(registry.FEATURES) <= set(data.columns):
+        data = data.rename(columns=registry.FITNESS_FEATURES)
+    frame = data.reindex(columns=list(FEATURE_COLUMNS))
+    return frame.apply(pd.to_numeric, errors="coerce").fillna(0.0).astype(float)
+
+
+class RiskBackend:
+    """
+    Base class for engine backends. predict() takes extract_features() output
+    and returns {"level", "reason"}; predict_batch() takes an
+    extract_feature_frame() frame and returns one level per row.
+    """
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    def predict(self, features: Dict[str, float]) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def predict_batch(self, frame: pd.DataFrame) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RulesBackend(RiskBackend):
+    name = "rules"
+
+    def predict(self, features):
+        return risk_ml.predict_risk(features)
+
+    def predict_batch(self, frame):
+        return risk_ml.predict_risk_levels(frame["steps"], frame["heart_rate"])
+
+
+class ForestBackend(RiskBackend):
+    name = "forest"
+
+    def available(self):
+        return registry.artifacts_available()
+
+    def predict(self, features):
+        from models.predict import predict_risk
+
+        level = predict_risk(*(features[c] for c in FEATURE_COLUMNS))
+        version = registry.get_compiled_model().version
+        return {"level": level, "reason": f"Predicted by the risk model ({version}) from 7 vitals"}
+
+    def predict_batch(self, frame):
+        from models.predict import predict_risk_batch
+
+        return predict_risk_batch(frame)["risk_level"].to_numpy()
+
+
+BACKENDS = {backend.name: backend for backend in (RulesBackend, ForestBackend)}
+
+
+class RiskEngine:
+    def __init__(self, backends: Optional[Sequence[str]] = None):
+        names = list(backends or DEFAULT_BACKENDS)
+        unknown = [n for n in names if n not in BACKENDS]
+        if unknown or not names:
+            raise ValueError(f"Unknown risk backends {unknown}; choose from {sorted(BACKENDS)}")
+        self.backends = [BACKENDS[n]() for n in names]
+        self._lock = threading.Lock()
+        self._stats = {n: {"calls": 0, "rows": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0}
+                       for n in names}
+
+    def _record(self, name: str, rows: int, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats["errors"] += error
+            if not error:
+                stats["rows"] += rows
+                stats["seconds"] += seconds
+                stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def _run(self, method: str, arg, rows: int):
+        """(backend name, result) from the first backend that is available and succeeds."""
+        for backend in self.backends:
+            if not backend.available():
+                continue
+            start = time.perf_counter()
+            try:
+                result = getattr(backend, method)(arg)
+            except Exception:
+                self._record(backend.name, rows, 0.0, error=True)
+                logger.warning("Risk backend %s failed; falling back", backend.name, exc_info=True)
+                continue
+            self._record(backend.name, rows, time.perf_counter() - start)
+            return backend.name, result
+        raise RuntimeError(f"No risk backend available out of {[b.name for b in self.backends]}")
+
+    def predict(self, fitness: Mapping[str, Any], baseline: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        fitness: fetch_fitness() dict. baseline: optional fetch_online_stats()
+        output, see risk_ml.apply_baseline.
+        Returns {"level", "reason", "backend"} (plus "unusual" with a baseline).
+        """
+        name, result = self._run("predict", extract_features(fitness), 1)
+        result = dict(result, backend=name)
+        if baseline is not None:
+            risk_ml.apply_baseline(result, fitness, baseline)
+        return result
+
+    def predict_batch(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Score every row of a fitness_data-shaped frame (or one with the
+        model's feature names, e.g. db_operations.fetch_risk_features()).
+        Returns a frame indexed like data with "risk_level" and the "backend"
+        that produced it.
+        """
+        frame = extract_feature_frame(data)
+        if frame.empty:
+            return pd.DataFrame({"risk_level": pd.Series(dtype=object), "backend": pd.Series(dtype=object)},
+                                index=frame.index)
+        name, levels = self._run("predict_batch", frame, len(frame))
+        return pd.DataFrame({"risk_level": np.asarray(levels, dtype=object), "backend": name}, index=frame.index)
+
+    def predict_users(self, user_ids=None) -> pd.DataFrame:
+        """
+        predict_batch() over the precomputed feature store vectors of user_ids
+        (every user with data when None), indexed by user_id.
+        """
+        from scripts.db_operations import fetch_risk_features
+
+        return self.predict_batch(fetch_risk_features(user_ids).set_index("user_id"))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per backend: calls, rows scored, errors, total / mean / max latency."""
+        with self._lock:
+            out = {}
+            for name, s in self._stats.items():
+                ok = s["calls"] - s["errors"]
+                out[name] = dict(s, mean_ms=round(s["seconds"] / ok * 1000, 3) if ok else None)
+            return out
+
+
+_engine: Optional[RiskEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_risk_engine() -> RiskEngine:
+    """The process-wide engine over DEFAULT_BACKENDS, built on first call."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RiskEngine()
+    return _engine
@@ -1,16 +1,80 @@
 # agents/risk_ml.py
-def predict_risk(fitness):
+RISK_LEVELS = ("High", "Medium", "Low")
+
+# (level, heart rate at or above, steps below, reason); first match wins
+RISK_RULES = (
+    ("High", 120, 1000, "Very high heart rate or very low activity"),
+    ("Medium", 100, 3000, "Elevated heart rate or low activity"),
+)
+
+# |z| against the user's own recent baseline that counts as unusual
+BASELINE_Z_ALERT = 3.0
+
+def _unusual_vitals(fitness, baseline):
+    """
+    Metrics whose reading on the fitness record's day is BASELINE_Z_ALERT+
+    standard deviations from the user's EWMA before that day. The stored
+    reading (baseline "last") is used, not fitness[metric]: fetch_fitness
+    reports a missing vital as 0, and a day without the reading is skipped.
+    """
+    unusual = {}
+    for metric, stats in (baseline or {}).items():
+        value, std = stats.get("last"), stats.get("prev_ewm_std")
+        if value is None or stats.get("last_date") != fitness.get("date"):
+            continue
+        if stats.get("prev_ewma") is None or not std:
+            continue
+        z = (float(value) - stats["prev_ewma"]) / std
+        if abs(z) >= BASELINE_Z_ALERT:
+            unusual[metric] = round(z, 2)
+    return unusual
+
+def predict_risk(fitness, baseline=None):
     """
     fitness: dict with keys 'steps', 'calories', 'heart_rate'
+    baseline: optional db_operations.fetch_online_stats() output for the same
+    user; a vital recorded on fitness['date'] that is far from the user's own
+    recent level raises Low to Medium.
     Returns: {'level': 'Low'|'Medium'|'High', 'reason': str}
+    (plus 'unusual': {metric: z} when a baseline is given)
     """
     steps = int(fitness.get("steps", 0) or 0)
     hr = int(fitness.get("heart_rate", 0) or 0)
     calories = int(fitness.get("calories", 0) or 0)
 
     # simple rule-based model (safe, explainable)
-    if hr >= 120 or steps < 1000:
-        return {"level": "High", "reason": "Very high heart rate or very low activity"}
-    if hr >= 100 or steps < 3000:
-        return {"level": "Medium", "reason": "Elevated heart rate or low activity"}
-    return {"level": "Low", "reason": "Normal vitals and activity"}
+    result = {"level": "Low", "reason": "Normal vitals and activity"}
+    for level, hr_limit, steps_limit, reason in RISK_RULES:
+        if hr >= hr_limit or steps < steps_limit:
+            result = {"level": level, "reason": reason}
+            break
+
+    if baseline is not None:
+        apply_baseline(result, fitness, baseline)
+    return result
+
+def apply_baseline(result, fitness, baseline):
+    """
+    Add 'unusual' to a {'level', 'reason'} result (in place) and raise Low to
+    Medium when a vital is far from the user's own baseline. Returns result.
+    """
+    unusual = _unusual_vitals(fitness, baseline)
+    result["unusual"] = unusual
+    if unusual:
+        if result["level"] == "Low":
+            result["level"] = "Medium"
+        result["reason"] += "; unusual for this patient: " + ", ".join(
+            f"{m} (z={z:+.1f})" for m, z in unusual.items())
+    return result
+
+def predict_risk_levels(steps, heart_rate):
+    """
+    Same rules as predict_risk for whole arrays / Series at once.
+    Missing values count as 0, as in predict_risk. Returns a numpy array of levels.
+    """
+    import numpy as np
+
+    steps = np.nan_to_num(np.asarray(steps, dtype=float))
+    hr = np.nan_to_num(np.asarray(heart_rate, dtype=float))
+    conditions = [(hr >= hr_limit) | (steps < steps_limit) for _, hr_limit, steps_limit, _ in RISK_RULES]
+    return np.select(conditions, [level for level, *_ in RISK_RULES], default="Low")
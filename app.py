@@ -11,7 +11,8 @@ from scripts.db_operations import (
     fetch_fitness,
     get_user_by_email,
     get_user_by_id,
-    fetch_patients_of_doctor
+    fetch_patients_of_doctor,
+    fetch_patients_overview
 )
 from ui import login_page
 from ui.registration import show_registration
@@ -159,11 +160,23 @@ if page == "Dashboard":
         st.info(f"🆔 Your Doctor ID: **{current_user['id']}**")
 
         st.subheader("👨‍⚕️ Your Patients")
-        patients = fetch_patients_of_doctor(user_id)
+        # One query for the whole panel (latest vitals + medication count)
+        patients = fetch_patients_overview(user_id)
 
         if patients:
-            for p in patients:
-                st.write(f"- **{p['name']}** ({p['email']}) — Patient ID: {p['id']}")
+            st.dataframe([
+                {
+                    "Patient ID": p["id"],
+                    "Name": p["name"],
+                    "Email": p["email"],
+                    "Steps": p["fitness"]["steps"],
+                    "Heart Rate": p["fitness"]["heart_rate"],
+                    "Systolic BP": p["fitness"]["bp"],
+                    "Medications": p["medication_count"],
+                    "Last Updated": p["last_updated"],
+                }
+                for p in patients
+            ], hide_index=True)
         else:
             st.warning("You currently have no assigned patients.")
 
@@ -390,7 +403,7 @@ elif page == "AI Assistant":
 elif page == "Patient Health Analytics":
     st.header("📈 Health Analytics")
     from ui import charts_section
-    charts_section.show_charts()
+    charts_section.show_charts(current_user["id"])
 
 # ----- Health Workflow / Goals / CSV Upload / Nutrition / Symptoms -----
 elif page == "Health Workflow":
@@ -1,10 +1,9 @@
-import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from scripts.db_operations import DB_NAME
 
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./health_agent.db")
+# Same database file as scripts/db_operations (configured there via DATABASE_URL)
+DATABASE_URL = f"sqlite:///{DB_NAME}"
 
 # sqlite needs check_same_thread
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
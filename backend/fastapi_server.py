@@ -1,6 +1,6 @@
 # fastapi_server.py
 """
-FastAPI server integrated with SQLite DB (uses health_data.db by default).
+FastAPI server integrated with the app's SQLite DB (via scripts/db_operations).
 Features:
 - /healthdata (existing)
 - /register (stores user with role)
@@ -10,12 +10,12 @@ Features:
 - /seed-demo-users (dev only; will create users only if they don't exist)
 
 Run:
-    uvicorn fastapi_server:app --reload --host 127.0.0.1 --port 8000
+    uvicorn backend.fastapi_server:app --reload --host 127.0.0.1 --port 8000
 """
 
 from fastapi import FastAPI, HTTPException, Depends, Header
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, Generator
+from typing import Optional, Dict, Any
 import os
 
 # dotenv (optional)
@@ -90,36 +90,14 @@ def get_health_data():
     }
     return fitness_data
 
-# --- Database setup (SQLAlchemy) ---
-# Default DB file name: health_data.db (use DATABASE_URL in .env to override)
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./health_data.db")
+# --- Database setup ---
+# Same database and data-access layer as the Streamlit app
+# (scripts/db_operations.py; DATABASE_URL in .env overrides the file).
+from scripts.db_operations import create_tables
+from backend.user_repository import AsyncUserRepository, run_blocking
 
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import sessionmaker, Session, declarative_base
-
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# User model (keeps parity with earlier roadmap)
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    role = Column(String, nullable=False, default="patient")
-
-# Create tables if they don't exist (safe; won't drop existing data)
-Base.metadata.create_all(bind=engine)
-
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Create / upgrade tables if needed (safe; won't drop existing data)
+create_tables()
 
 # --- Pydantic schemas ---
 class RegisterIn(BaseModel):
@@ -132,31 +110,32 @@ class LoginIn(BaseModel):
     email: str
     password: str
 
+# Async access to the users table: blocking DB work and bcrypt run on a
+# bounded thread pool (see backend/user_repository.py).
+users_repo = AsyncUserRepository()
+
 # --- Auth endpoints using DB ---
 @app.post("/register")
-def register(user: RegisterIn, db: Session = Depends(get_db)):
+async def register(user: RegisterIn):
     allowed = {"patient", "doctor", "caregiver"}
     if user.role not in allowed:
         raise HTTPException(status_code=400, detail=f"Invalid role. Allowed: {allowed}")
 
-    exists = db.query(User).filter(User.email == user.email.lower()).first()
+    exists = await users_repo.get_by_email(user.email)
     if exists:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed = hash_password(user.password)
-    db_user = User(name=user.name, email=user.email.lower(), password_hash=hashed, role=user.role)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return {"id": db_user.id, "email": db_user.email, "role": db_user.role}
+    hashed = await run_blocking(hash_password, user.password)
+    db_user = await users_repo.add(user.name, user.email, hashed, user.role)
+    return {"id": db_user["id"], "email": db_user["email"], "role": db_user["role"]}
 
 @app.post("/login")
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == payload.email.lower()).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login(payload: LoginIn):
+    user = await users_repo.get_by_email(payload.email)
+    if not user or not await run_blocking(verify_password, payload.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = create_access_token({"user_id": user.id, "email": user.email, "role": user.role})
-    return {"access_token": token, "token_type": "bearer", "role": user.role}
+    token = create_access_token({"user_id": user["id"], "email": user["email"], "role": user["role"]})
+    return {"access_token": token, "token_type": "bearer", "role": user["role"]}
 
 # --- Token helper ---
 def get_current_user_from_header(authorization: Optional[str] = Header(None)):
@@ -183,19 +162,13 @@ def patient_only(current_user: Dict = Depends(get_current_user_from_header)):
 
 # --- Dev helper: seed users if missing (will not overwrite existing users) ---
 @app.post("/seed-demo-users")
-def seed_demo_users(db: Session = Depends(get_db)):
+async def seed_demo_users():
     demo = [
         ("Patient One", "patient@example.com", "patient123", Role.PATIENT if hasattr(Role, "PATIENT") else "patient"),
         ("Doctor One", "doctor@example.com", "doctor123", Role.DOCTOR if hasattr(Role, "DOCTOR") else "doctor"),
         ("Caregiver One", "caregiver@example.com", "caregiver123", Role.CAREGIVER if hasattr(Role, "CAREGIVER") else "caregiver"),
     ]
-    added = 0
-    for name, email, pwd, role in demo:
-        if not db.query(User).filter(User.email == email.lower()).first():
-            db.add(User(name=name, email=email.lower(), password_hash=hash_password(pwd), role=role))
-            added += 1
-    if added:
-        db.commit()
+    added = await users_repo.add_missing(demo, hash_password)
     return {"message": "Seed complete", "added": added}
 
 # End of file
@@ -0,0 +1,64 @@
+# backend/user_repository.py
+"""
+Async data access for the FastAPI backend.
+
+Reads and writes go through scripts/db_operations (the same layer and
+database the Streamlit app uses). Those calls, and bcrypt, are blocking, so
+every call is shipped to a dedicated, bounded thread pool instead of the
+event loop or Starlette's shared threadpool. Endpoints can then be
+`async def`: while one request waits on SQLite, the worker keeps accepting
+and serving others, and at most DB_MAX_WORKERS blocking calls run at once
+(extra calls queue in the pool). Each pool thread keeps its own long-lived
+connection (see db_operations.get_connection).
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from scripts import db_operations
+
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable (DB query, bcrypt hash/verify) on the bounded pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+class AsyncUserRepository:
+    """
+    Async wrapper around the users functions in db_operations.
+    Emails are stored lower-cased, as the API always has.
+    """
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await run_blocking(db_operations.get_user_by_email, email.lower())
+
+    async def add(self, name: str, email: str, password_hash: str, role: str,
+                  phone: Optional[str] = None) -> Dict[str, Any]:
+        user_id = await run_blocking(db_operations.add_user, name, email.lower(), phone, password_hash, role)
+        return {"id": user_id, "name": name, "email": email.lower(), "role": role}
+
+    async def add_missing(self, users: Iterable[Tuple[str, str, str, str]],
+                          hash_password: Callable[[str], str]) -> int:
+        """
+        Insert (name, email, plain_password, role) rows whose email is not taken
+        yet. Only the new rows pay for hashing. Returns how many were added.
+        """
+        users = list(users)
+
+        def insert_missing():
+            added = 0
+            for name, email, password, role in users:
+                if not db_operations.get_user_by_email(email.lower()):
+                    db_operations.add_user(name, email.lower(), None, hash_password(password), role)
+                    added += 1
+            return added
+
+        return await run_blocking(insert_missing)
@@ -0,0 +1,157 @@
+# models/compiled_forest.py
+"""
+The risk RandomForest and its StandardScaler flattened into plain NumPy arrays,
+with a small evaluator that gives the same probabilities as sklearn.
+
+sklearn's predict_proba validates input, builds a thread pool and walks 200
+trees one by one, which costs milliseconds for a single patient. Here all
+trees live in a handful of contiguous arrays:
+
+    feature, threshold, left, right   one entry per node (all trees back to back)
+    value                             per-node class probabilities
+    roots                             index of each tree's root node
+
+Leaves point to themselves (threshold +inf, left = right = self), so scoring
+is max_depth rounds of "step every tree one level down", vectorized over
+trees and rows - no Python loop per tree or per node.
+
+Build the arrays with export_forest(), or get the process-wide copy through
+models.registry.get_compiled_model(), which caches them next to the pickle
+(COMPILED_FILE) keyed by the model's version.
+
+Compare with the sklearn path:
+    python -m models.compiled_forest [--rows 1000]
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from typing import Sequence
+
+import numpy as np
+
+COMPILED_FILE = "risk_model_compiled.npz"
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 scaler_mean, scaler_scale, classes, version: str = ""):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        self.classes = np.asarray(classes)
+        self.version = version
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right,
+                                      self.value, self.roots, self.scaler_mean, self.scaler_scale))
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Class probabilities for raw (unscaled) feature rows, shape (n, n_classes).
+        Features are compared in float32 like sklearn's trees do.
+        """
+        x = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        x = ((x - self.scaler_mean) / self.scaler_scale).astype(np.float32)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(x), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = x[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        """Class labels (e.g. "Low") for raw feature rows."""
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path: str):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, roots=self.roots, max_depth=self.max_depth,
+                 scaler_mean=self.scaler_mean, scaler_scale=self.scaler_scale,
+                 classes=self.classes, version=self.version)
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays["max_depth"] = int(arrays["max_depth"])
+        arrays["version"] = str(arrays["version"])
+        return cls(**arrays)
+
+
+def export_forest(model, scaler, class_labels: Sequence[str], version: str = "") -> CompiledForest:
+    """
+    Flatten a fitted RandomForestClassifier (or single tree) and StandardScaler.
+    class_labels: label for each entry of model.classes_, in that order.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = max_depth = 0
+    for estimator in getattr(model, "estimators_", [model]):
+        tree = estimator.tree_
+        n = tree.node_count
+        ids = np.arange(n)
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(np.where(leaf, ids, tree.children_left) + offset)
+        rights.append(np.where(leaf, ids, tree.children_right) + offset)
+        value = tree.value[:, 0, :].astype(np.float64)
+        values.append(value / value.sum(axis=1, keepdims=True))
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.concatenate(features), threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts), right=np.concatenate(rights),
+        value=np.concatenate(values), roots=np.array(roots), max_depth=max_depth,
+        scaler_mean=scaler.mean_, scaler_scale=scaler.scale_,
+        classes=np.asarray(class_labels, dtype=str), version=version,
+    )
+
+
+def export_bundle(bundle) -> CompiledForest:
+    """export_forest() for a models.registry.RiskModelBundle."""
+    labels = bundle.encoder.inverse_transform(bundle.model.classes_)
+    return export_forest(bundle.model, bundle.scaler, labels, version=bundle.version)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import pandas as pd
+
+    from models.registry import FEATURES, MODELS_DIR, get_compiled_model, get_risk_model
+
+    parser = argparse.ArgumentParser(description="Benchmark the compiled forest against sklearn.")
+    parser.add_argument("--rows", type=int, default=1000, help="single-row predictions to time")
+    args = parser.parse_args()
+
+    bundle = get_risk_model()
+    compiled = get_compiled_model()
+    data = pd.read_csv(os.path.join(MODELS_DIR, "health_data.csv"))[list(FEATURES)]
+    rows = data.to_numpy(dtype=float)[:args.rows]
+
+    def sklearn_one(row):
+        x = bundle.scaler.transform(pd.DataFrame([row], columns=list(FEATURES)))
+        return bundle.model.predict_proba(x)
+
+    for name, fn in (("sklearn", sklearn_one), ("compiled", compiled.predict_proba)):
+        start = time.perf_counter()
+        for row in rows:
+            fn(row)
+        per_row = (time.perf_counter() - start) / len(rows)
+        print(f"{name:>9}: {per_row * 1e6:9.1f} us per single-row prediction")
+
+    start = time.perf_counter()
+    compiled.predict_proba(data.to_numpy(dtype=float))
+    print(f" compiled: {time.perf_counter() - start:.3f}s for all {len(data)} rows in one call")
+    same = (compiled.predict(data) == bundle.encoder.inverse_transform(
+        bundle.model.predict(bundle.scaler.transform(data)))).mean()
+    print(f"label agreement with sklearn: {same:.2%}; arrays: {compiled.nbytes / 1024:.0f} KiB")
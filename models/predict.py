@@ -1,16 +1,84 @@
-import joblib
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import copy
+
 import numpy as np
+import pandas as pd
 
-model = joblib.load("risk_model.pkl")
-encoder = joblib.load("risk_label_encoder.pkl")
-scaler = joblib.load("risk_scaler.pkl")
+from models.registry import FEATURES, FITNESS_FEATURES, get_compiled_model, get_risk_model, prediction_cache
 
 def predict_risk(BMI, Daily_Steps, Calories_Intake, Hours_of_Sleep, Heart_Rate, Systolic_BP, Exercise_Hours_per_Week):
-    x = np.array([[BMI, Daily_Steps, Calories_Intake, Hours_of_Sleep, Heart_Rate, Systolic_BP, Exercise_Hours_per_Week]])
-    x_scaled = scaler.transform(x)
-    prediction = model.predict(x_scaled)[0]
-    return encoder.inverse_transform([prediction])[0]
-
-# Example
-risk = predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7)
-print("Predicted Risk:", risk)
+    # Single rows go through the flattened forest (models/compiled_forest.py):
+    # same result as the sklearn model without its per-call overhead.
+    # Repeats of the exact same record are answered from the LRU cache.
+    x = tuple(float(v) for v in (BMI, Daily_Steps, Calories_Intake, Hours_of_Sleep, Heart_Rate, Systolic_BP,
+                                 Exercise_Hours_per_Week))
+    compiled = get_compiled_model()
+    key = (compiled.version, x)
+    level = prediction_cache.get(key)
+    if level is None:
+        level = str(compiled.predict(x)[0])
+        prediction_cache.set(key, level)
+    return level
+
+def predict_risk_for_user(user_id):
+    """
+    predict_risk() on the user's precomputed feature vector
+    (scripts/feature_store.py); None when the user has no fitness data.
+    """
+    from scripts.db_operations import fetch_risk_feature_vector
+
+    vector = fetch_risk_feature_vector(user_id)
+    return None if vector is None else predict_risk(*vector)
+
+def _feature_frame(data) -> pd.DataFrame:
+    """
+    FEATURES-ordered frame from a DataFrame (model feature names or
+    fitness_data column names) or an n x 7 array in FEATURES order.
+    """
+    if isinstance(data, pd.DataFrame):
+        if set(FEATURES) <= set(data.columns):
+            return data[list(FEATURES)].astype(float)
+        if set(FITNESS_FEATURES.values()) <= set(data.columns):
+            return data[[FITNESS_FEATURES[f] for f in FEATURES]].set_axis(list(FEATURES), axis=1).astype(float)
+        raise ValueError(f"DataFrame needs the columns {list(FEATURES)} or {list(FITNESS_FEATURES.values())}")
+    x = np.asarray(data, dtype=float)
+    if x.ndim != 2 or x.shape[1] != len(FEATURES):
+        raise ValueError(f"Expected a 2-D array with {len(FEATURES)} columns in the order {list(FEATURES)}")
+    return pd.DataFrame(x, columns=list(FEATURES))
+
+def predict_risk_batch(data=None, user_ids=None, n_jobs=None) -> pd.DataFrame:
+    """
+    Score many rows in one scaler / forest call.
+    data: DataFrame or 2-D array (see _feature_frame); or
+    user_ids: score each user's precomputed feature vector (users without data are left out).
+    n_jobs: worker threads for the forest (default: the model's own setting; -1 = all cores).
+    Returns a DataFrame with "risk_level" and one "p_<level>" probability column
+    per class, indexed like `data` or by user_id.
+    """
+    if (data is None) == (user_ids is None):
+        raise ValueError("Pass either data or user_ids")
+    if user_ids is not None:
+        from scripts.db_operations import fetch_risk_features
+        data = fetch_risk_features(user_ids).set_index("user_id")
+    X = _feature_frame(data)
+
+    bundle = get_risk_model()
+    model = bundle.model
+    if n_jobs is not None and n_jobs != model.n_jobs:
+        model = copy.copy(model)  # shallow: shares the fitted trees with the cached model
+        model.n_jobs = n_jobs
+    class_labels = bundle.encoder.inverse_transform(model.classes_)
+    columns = ["risk_level"] + [f"p_{label}" for label in class_labels]
+    if X.empty:
+        return pd.DataFrame(columns=columns, index=X.index)
+
+    proba = model.predict_proba(bundle.scaler.transform(X))
+    result = pd.DataFrame(proba, index=X.index, columns=columns[1:])
+    result.insert(0, "risk_level", class_labels[proba.argmax(axis=1)])
+    return result
+
+if __name__ == "__main__":
+    # Example
+    risk = predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7)
+    print("Predicted Risk:", risk)
@@ -0,0 +1,205 @@
+# models/registry.py
+"""
+Process-wide access to the trained risk model artifacts.
+
+The RandomForest, label encoder and scaler saved by models/risk_ml.py are
+loaded on first use (not at import), from paths resolved against this
+package - or RISK_MODEL_DIR - so callers work from any working directory.
+Every caller in the process shares the one loaded bundle; reload_risk_model()
+swaps in freshly trained files.
+
+Set RISK_MODEL_MMAP=r to open the artifacts with joblib's memory mapping, so
+numpy arrays stored in the files are paged in from disk instead of copied.
+
+model_metrics() reports how long the load took and how much memory the
+model holds, for logs and health endpoints.
+
+prediction_cache is a bounded LRU for models.predict.predict_risk: keys are
+(model version, exact feature values), so re-scoring an unchanged record on
+every Streamlit rerun is a dict lookup and a hit is always the answer the
+model gives for that input. Reloading the model clears it.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from scripts.cache import TTLCache
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.getenv("RISK_MODEL_DIR", MODELS_DIR)
+MODEL_MMAP_MODE = os.getenv("RISK_MODEL_MMAP") or None
+
+# Files written by models/risk_ml.py
+ARTIFACTS = {
+    "model": "risk_model.pkl",
+    "encoder": "risk_label_encoder.pkl",
+    "scaler": "risk_scaler.pkl",
+}
+# Column order the model was trained on
+FEATURES = ("BMI", "Daily_Steps", "Calories_Intake", "Hours_of_Sleep", "Heart_Rate",
+            "Systolic_BP", "Exercise_Hours_per_Week")
+# fitness_data column feeding each feature (same units: exercise is hours per week)
+FITNESS_FEATURES = {
+    "BMI": "bmi",
+    "Daily_Steps": "steps",
+    "Calories_Intake": "calories",
+    "Hours_of_Sleep": "sleep",
+    "Heart_Rate": "heart_rate",
+    "Systolic_BP": "bp",
+    "Exercise_Hours_per_Week": "exercise",
+}
+
+PREDICTION_CACHE_SIZE = int(os.getenv("RISK_PREDICTION_CACHE_SIZE", "10000"))
+prediction_cache = TTLCache(maxsize=PREDICTION_CACHE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+
+class RiskModelBundle:
+    """The loaded artifacts plus what it cost to load them."""
+
+    def __init__(self, model, encoder, scaler, version: str, metrics: Dict[str, Any]):
+        self.model = model
+        self.encoder = encoder
+        self.scaler = scaler
+        self.version = version
+        self.metrics = metrics
+
+
+def _artifact_path(name: str, model_dir: Optional[str] = None) -> str:
+    return os.path.join(model_dir or MODEL_DIR, ARTIFACTS[name])
+
+
+def artifacts_available(model_dir: Optional[str] = None) -> bool:
+    """True when every file in ARTIFACTS exists in model_dir (default MODEL_DIR)."""
+    return all(os.path.exists(_artifact_path(name, model_dir)) for name in ARTIFACTS)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _model_nbytes(model) -> int:
+    """Bytes held by the fitted trees' node and value arrays."""
+    total = 0
+    for estimator in getattr(model, "estimators_", [model]):
+        tree = getattr(estimator, "tree_", None)
+        if tree is not None:
+            state = tree.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+    return total
+
+
+def load_risk_model(model_dir: Optional[str] = None, mmap_mode: Optional[str] = MODEL_MMAP_MODE) -> RiskModelBundle:
+    """
+    Load the artifacts from model_dir (default MODEL_DIR). Always reads the
+    files; use get_risk_model() for the shared instance.
+    """
+    import joblib
+
+    paths = {name: _artifact_path(name, model_dir) for name in ARTIFACTS}
+    start = time.perf_counter()
+    loaded = {name: joblib.load(path, mmap_mode=mmap_mode) for name, path in paths.items()}
+    load_seconds = time.perf_counter() - start
+
+    metrics = {
+        "path": os.path.dirname(paths["model"]),
+        "load_seconds": round(load_seconds, 4),
+        "artifact_bytes": sum(os.path.getsize(p) for p in paths.values()),
+        "model_bytes": _model_nbytes(loaded["model"]),
+        "n_estimators": len(getattr(loaded["model"], "estimators_", [])),
+        "mmap_mode": mmap_mode,
+        "loaded_at": time.time(),
+    }
+    version = _file_digest(paths["model"])
+    logger.info("Loaded risk model %s from %s in %.3fs", version, metrics["path"], load_seconds)
+    return RiskModelBundle(loaded["model"], loaded["encoder"], loaded["scaler"], version, metrics)
+
+
+_lock = threading.RLock()  # get_compiled_model may load the bundle while holding it
+_bundle: Optional[RiskModelBundle] = None
+_compiled = None
+_load_count = 0
+
+
+def get_risk_model() -> RiskModelBundle:
+    """
+    The process-wide bundle, loaded on first call. Concurrent first calls
+    wait for a single load.
+    """
+    global _bundle, _load_count
+    bundle = _bundle
+    if bundle is None:
+        with _lock:
+            if _bundle is None:
+                _bundle = load_risk_model()
+                _load_count += 1
+            bundle = _bundle
+    return bundle
+
+
+def reload_risk_model(model_dir: Optional[str] = None) -> RiskModelBundle:
+    """
+    Load the artifacts again (e.g. after retraining) and make them the shared
+    bundle. Callers holding the old bundle keep a consistent model until done.
+    """
+    global _bundle, _compiled, _load_count
+    with _lock:
+        _bundle = load_risk_model(model_dir)
+        _compiled = None
+        prediction_cache.clear()
+        _load_count += 1
+        return _bundle
+
+
+def get_compiled_model():
+    """
+    The process-wide models.compiled_forest.CompiledForest for the current
+    model. Read from COMPILED_FILE next to the pickle when its version matches
+    (no sklearn unpickling needed); otherwise exported from the loaded model
+    and written there for next time.
+    """
+    global _compiled
+    compiled = _compiled
+    if compiled is not None:
+        return compiled
+
+    from models.compiled_forest import COMPILED_FILE, CompiledForest, export_bundle
+
+    with _lock:
+        if _compiled is None:
+            model_dir = _bundle.metrics["path"] if _bundle is not None else MODEL_DIR
+            version = _bundle.version if _bundle is not None else _file_digest(_artifact_path("model", model_dir))
+            path = os.path.join(model_dir, COMPILED_FILE)
+            if os.path.exists(path):
+                cached = CompiledForest.load(path)
+                if cached.version == version:
+                    _compiled = cached
+        if _compiled is None:
+            bundle = get_risk_model()
+            _compiled = export_bundle(bundle)
+            try:
+                _compiled.save(os.path.join(bundle.metrics["path"], COMPILED_FILE))
+            except OSError:
+                logger.warning("Could not cache the compiled risk model in %s", bundle.metrics["path"])
+        return _compiled
+
+
+def model_metrics() -> Dict[str, Any]:
+    """
+    Load metrics of the shared bundle ({"loaded": False} before first use)
+    plus prediction_cache counters.
+    """
+    bundle = _bundle
+    cache = prediction_cache.stats()
+    if bundle is None:
+        return {"loaded": False, "load_count": _load_count, "prediction_cache": cache}
+    return {"loaded": True, "version": bundle.version, "load_count": _load_count,
+            "prediction_cache": cache, **bundle.metrics}
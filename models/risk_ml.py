@@ -1,3 +1,7 @@
+# Trains the original model from the labelled seed CSV.
+# Retraining (seed labels, fitness_data opt-in): python -m models.train
+import os
+
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
@@ -7,7 +11,8 @@ import joblib
 # ---------------------------------------
 # 1. Load dataset
 # ---------------------------------------
-df = pd.read_csv("health_data.csv")  # your dataset
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+df = pd.read_csv(os.path.join(MODELS_DIR, "health_data.csv"))  # your dataset
 
 # Features and target
 X = df[["BMI", "Daily_Steps", "Calories_Intake", "Hours_of_Sleep", "Heart_Rate", "Systolic_BP", "Exercise_Hours_per_Week"]]
@@ -53,8 +58,8 @@ print("Model Accuracy:", accuracy)
 # ---------------------------------------
 # 7. Save model & encoder & scaler
 # ---------------------------------------
-joblib.dump(model, "risk_model.pkl")
-joblib.dump(encoder, "risk_label_encoder.pkl")
-joblib.dump(scaler, "risk_scaler.pkl")
+joblib.dump(model, os.path.join(MODELS_DIR, "risk_model.pkl"))
+joblib.dump(encoder, os.path.join(MODELS_DIR, "risk_label_encoder.pkl"))
+joblib.dump(scaler, os.path.join(MODELS_DIR, "risk_scaler.pkl"))
 
 print("Model saved successfully!")
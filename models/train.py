@@ -0,0 +1,357 @@
+# models/train.py
+"""
+Retraining of the risk model, with production fitness_data as an opt-in source.
+
+    python -m models.train [--full] [--n-jobs N] [--rule-labels] [--promote]
+
+Labels: the hand-labelled SEED_CSV is the only source of real risk labels.
+It is split once, the same way models/risk_ml.py splits it, and the held-out
+part is never trained on: every version reports seed_holdout_accuracy on it,
+and that is the number promotion is judged by.
+
+fitness_data carries no outcome label. With rule_labels=True (--rule-labels)
+its rows are labelled by the rules in agents.risk_ml and added to training;
+the forest then partly learns to copy those rules, so cv_accuracy (scored on
+the training labels) is only meaningful without them. The rows are read in
+id order, CHUNK_ROWS at a time (keyset pagination on the primary key), and
+only complete rows are used.
+
+Two modes:
+- full: hyperparameter search (GridSearchCV over PARAM_GRID, stratified
+  CV_FOLDS-fold CV, run across n_jobs cores) with SEARCH_TREES-tree forests
+  on at most SEARCH_SAMPLE_ROWS rows, then the final forest is fitted on the
+  seed training split (plus rule-labelled rows when opted in).
+- warm (rule_labels only): when the previous version exists and its forest
+  is below MAX_TREES, WARM_START_TREES new trees are grown on the rows that
+  arrived since its last_fitness_id with the previous scaler and encoder, so
+  the cost follows the new data rather than the table size.
+  new_rows_accuracy is the previous forest's agreement with the rules on
+  those rows, taken before they are learnt. Fewer than MIN_NEW_ROWS new rows
+  skips the run.
+
+Every run writes VERSIONS_DIR/<version>/ with the three artifacts
+(models.registry.ARTIFACTS) and METRICS_FILE. Nothing is deployed unless
+asked: with promote_result=True (--promote) the version replaces the
+artifacts the registry loads only if its seed_holdout_accuracy is not below
+that of the model currently there.
+"""
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import logging
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models import registry
+
+SEED_CSV = os.path.join(registry.MODELS_DIR, "health_data.csv")
+VERSIONS_DIR = os.path.join(registry.MODELS_DIR, "versions")
+METRICS_FILE = "metrics.json"
+PROMOTED_METRICS_FILE = "risk_model_metrics.json"  # METRICS_FILE as copied by promote()
+
+CHUNK_ROWS = 50000
+# Seed rows held out for evaluation: the split models/risk_ml.py uses
+SEED_HOLDOUT_FRACTION = 0.2
+SEED_SPLIT_RANDOM_STATE = 42
+SEARCH_SAMPLE_ROWS = 5000
+SEARCH_TREES = 100  # forest size while comparing parameters; the final fit uses BASE_PARAMS
+CV_FOLDS = 5
+BASE_PARAMS = {"n_estimators": 200, "random_state": 42}
+PARAM_GRID = {"max_depth": [6, 8, 12], "min_samples_leaf": [1, 5], "max_features": ["sqrt", None]}
+WARM_START_TREES = 50
+MAX_TREES = 500
+MIN_NEW_ROWS = 100
+
+FITNESS_COLUMNS = [registry.FITNESS_FEATURES[f] for f in registry.FEATURES]
+
+logger = logging.getLogger(__name__)
+
+
+def read_fitness_chunks(conn: sqlite3.Connection, after_id: int = 0,
+                        chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Complete fitness_data rows with id > after_id, as frames of id plus
+    FEATURES columns (model names), chunk_rows at a time in id order.
+    """
+    sql = f"""
+        SELECT id, {', '.join(FITNESS_COLUMNS)} FROM fitness_data
+        WHERE id > ? AND {' AND '.join(f'{c} IS NOT NULL' for c in FITNESS_COLUMNS)}
+        ORDER BY id LIMIT ?
+    """
+    last_id = after_id
+    while True:
+        rows = conn.execute(sql, (last_id, chunk_rows)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield pd.DataFrame.from_records(rows, columns=["id"] + list(registry.FEATURES))
+
+
+def label_rows(features: pd.DataFrame) -> np.ndarray:
+    """Risk labels for unlabelled rows: the rule levels of agents.risk_ml."""
+    from agents.risk_ml import predict_risk_levels
+
+    return predict_risk_levels(features["Daily_Steps"], features["Heart_Rate"])
+
+
+def load_seed() -> Tuple[pd.DataFrame, np.ndarray, pd.DataFrame, np.ndarray]:
+    """SEED_CSV as (X_train, y_train, X_holdout, y_holdout), split like models/risk_ml.py."""
+    from sklearn.model_selection import train_test_split
+
+    seed = pd.read_csv(SEED_CSV)
+    X = seed[list(registry.FEATURES)].astype(float)
+    y = seed["Risk_Level"].to_numpy(dtype=object)
+    X_train, X_holdout, y_train, y_holdout = train_test_split(
+        X, y, test_size=SEED_HOLDOUT_FRACTION, random_state=SEED_SPLIT_RANDOM_STATE)
+    return X_train.reset_index(drop=True), y_train, X_holdout.reset_index(drop=True), y_holdout
+
+
+def seed_holdout_accuracy(model, encoder, scaler) -> float:
+    """Accuracy of a model / encoder / scaler against the real labels of the seed holdout."""
+    _, _, X_holdout, y_holdout = load_seed()
+    predicted = encoder.inverse_transform(model.predict(scaler.transform(X_holdout)))
+    return round(float((predicted == y_holdout).mean()), 4)
+
+
+def load_training_data(conn: sqlite3.Connection, after_id: int = 0, include_seed: bool = True,
+                       rule_labels: bool = False,
+                       chunk_rows: int = CHUNK_ROWS) -> Tuple[pd.DataFrame, np.ndarray, int, Dict[str, int]]:
+    """
+    (X, y, last fitness_data id read, row counts by label source): the seed
+    training split when include_seed, plus rule-labelled fitness_data rows
+    after after_id when rule_labels.
+    """
+    frames, labels, counts = [], [], {"seed": 0, "rules": 0}
+    if include_seed:
+        X_seed, y_seed, _, _ = load_seed()
+        frames.append(X_seed)
+        labels.append(y_seed)
+        counts["seed"] = len(X_seed)
+    last_id = after_id
+    for chunk in read_fitness_chunks(conn, after_id, chunk_rows) if rule_labels else ():
+        last_id = int(chunk["id"].iloc[-1])
+        features = chunk[list(registry.FEATURES)].astype(float)
+        frames.append(features)
+        labels.append(label_rows(features).astype(object))
+        counts["rules"] += len(chunk)
+    if not frames:
+        return pd.DataFrame(columns=list(registry.FEATURES), dtype=float), np.array([], dtype=object), last_id, counts
+    return pd.concat(frames, ignore_index=True), np.concatenate(labels), last_id, counts
+
+
+def search_params(X: np.ndarray, y: np.ndarray, n_jobs: int = -1,
+                  param_grid: Optional[Dict[str, list]] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Best forest parameters by stratified CV, fits spread over n_jobs cores.
+    Searches on a stratified sample of at most SEARCH_SAMPLE_ROWS rows.
+    Returns (best params, {"cv_accuracy", "cv_std", "search_rows"}).
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
+
+    if len(X) > SEARCH_SAMPLE_ROWS:
+        X, _, y, _ = train_test_split(X, y, train_size=SEARCH_SAMPLE_ROWS, stratify=y, random_state=42)
+    search = GridSearchCV(
+        RandomForestClassifier(**dict(BASE_PARAMS, n_estimators=SEARCH_TREES)),
+        param_grid or PARAM_GRID,
+        cv=StratifiedKFold(CV_FOLDS, shuffle=True, random_state=42),
+        scoring="accuracy",
+        n_jobs=n_jobs,
+    )
+    search.fit(X, y)
+    best = search.best_index_
+    return search.best_params_, {
+        "cv_accuracy": round(float(search.cv_results_["mean_test_score"][best]), 4),
+        "cv_std": round(float(search.cv_results_["std_test_score"][best]), 4),
+        "search_rows": len(X),
+    }
+
+
+def latest_version(versions_dir: str = VERSIONS_DIR) -> Optional[Dict[str, Any]]:
+    """METRICS_FILE contents of the newest version in versions_dir (None if there is none)."""
+    if not os.path.isdir(versions_dir):
+        return None
+    for name in sorted(os.listdir(versions_dir), reverse=True):
+        path = os.path.join(versions_dir, name, METRICS_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+    return None
+
+
+def _fit_full(conn, n_jobs, include_seed, rule_labels, param_grid, chunk_rows):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    timings = {}
+    start = time.perf_counter()
+    X, y, last_id, counts = load_training_data(conn, 0, include_seed, rule_labels, chunk_rows)
+    timings["load_seconds"] = time.perf_counter() - start
+    if len(X) == 0:
+        raise ValueError("No training data: pass include_seed and / or rule_labels")
+
+    encoder = LabelEncoder()
+    y_encoded = encoder.fit_transform(y)
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    start = time.perf_counter()
+    params, cv = search_params(X_scaled, y_encoded, n_jobs, param_grid)
+    timings["search_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = RandomForestClassifier(**BASE_PARAMS, **params, n_jobs=n_jobs)
+    model.fit(X_scaled, y_encoded)
+    timings["fit_seconds"] = time.perf_counter() - start
+
+    info = {"mode": "full", "parent": None, "params": dict(BASE_PARAMS, **params), **cv,
+            "rows": counts, "train_rows": len(X), "last_fitness_id": last_id}
+    return model, encoder, scaler, info, timings
+
+
+def _fit_warm(conn, parent, parent_dir, n_jobs, chunk_rows):
+    """Grow the parent forest on rule-labelled rows newer than parent["last_fitness_id"]; None when it cannot be."""
+    timings = {}
+    start = time.perf_counter()
+    X, y, last_id, counts = load_training_data(conn, parent["last_fitness_id"], False, True, chunk_rows)
+    timings["load_seconds"] = time.perf_counter() - start
+
+    bundle = registry.load_risk_model(parent_dir)
+    model, encoder, scaler = bundle.model, bundle.encoder, bundle.scaler
+    if model.n_estimators + WARM_START_TREES > MAX_TREES:
+        return None
+    if set(np.unique(y)) != set(encoder.classes_):
+        return None  # the new trees would not know every class; retrain instead
+
+    # Test-then-train: the parent is scored on the new rows before it sees them.
+    X_scaled, y_encoded = scaler.transform(X), encoder.transform(y)
+    new_rows_accuracy = model.score(X_scaled, y_encoded)
+    start = time.perf_counter()
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + WARM_START_TREES, n_jobs=n_jobs)
+    model.fit(X_scaled, y_encoded)
+    model.set_params(warm_start=False)
+    timings["fit_seconds"] = time.perf_counter() - start
+
+    info = {"mode": "warm", "parent": parent["version"], "params": model.get_params(deep=False),
+            "cv_accuracy": parent.get("cv_accuracy"), "cv_std": parent.get("cv_std"),
+            "new_rows_accuracy": round(float(new_rows_accuracy), 4), "rows": counts,
+            "train_rows": len(X), "last_fitness_id": last_id}
+    return model, encoder, scaler, info, timings
+
+
+def count_new_rows(conn: sqlite3.Connection, after_id: int) -> int:
+    """Complete fitness_data rows with id > after_id."""
+    return conn.execute(f"""
+        SELECT COUNT(*) FROM fitness_data
+        WHERE id > ? AND {' AND '.join(f'{c} IS NOT NULL' for c in FITNESS_COLUMNS)}
+    """, (after_id,)).fetchone()[0]
+
+
+def promote(version_dir: str, model_dir: Optional[str] = None):
+    """
+    Make a saved version the one models.registry loads: copy its artifacts
+    into model_dir (default registry.MODEL_DIR), each replaced atomically,
+    and reload the shared model if this process has it loaded.
+    """
+    model_dir = model_dir or registry.MODEL_DIR
+    files = {name: name for name in registry.ARTIFACTS.values()}
+    files[METRICS_FILE] = PROMOTED_METRICS_FILE
+    for source, target in files.items():
+        tmp = os.path.join(model_dir, f".{target}.tmp")
+        shutil.copyfile(os.path.join(version_dir, source), tmp)
+        os.replace(tmp, os.path.join(model_dir, target))
+    if registry.model_metrics()["loaded"]:
+        registry.reload_risk_model(model_dir)
+
+
+def deployed_seed_holdout_accuracy(model_dir: Optional[str] = None) -> Optional[float]:
+    """seed_holdout_accuracy of the artifacts in model_dir (default registry.MODEL_DIR); None if absent."""
+    if not registry.artifacts_available(model_dir):
+        return None
+    bundle = registry.load_risk_model(model_dir)
+    return seed_holdout_accuracy(bundle.model, bundle.encoder, bundle.scaler)
+
+
+def train(conn: Optional[sqlite3.Connection] = None, full: bool = False, n_jobs: int = -1,
+          include_seed: bool = True, rule_labels: bool = False, promote_to: Optional[str] = None,
+          promote_result: bool = False, versions_dir: str = VERSIONS_DIR,
+          param_grid: Optional[Dict[str, list]] = None, chunk_rows: int = CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Train a new version and save it under versions_dir: warm start from the
+    previous version when rule_labels and not full, else a full retrain.
+    promote_result deploys it to promote_to (default registry.MODEL_DIR)
+    unless its seed_holdout_accuracy is below the deployed model's.
+    Returns the saved metrics (with "promoted") - or, for a warm run with
+    fewer than MIN_NEW_ROWS new rows, the previous version's metrics with
+    "skipped": True and nothing written.
+    """
+    import joblib
+
+    if conn is None:
+        from scripts.db_operations import get_connection
+        conn = get_connection()
+
+    started = time.perf_counter()
+    parent = latest_version(versions_dir) if rule_labels and not full else None
+    result = None
+    if parent is not None:
+        new_rows = count_new_rows(conn, parent["last_fitness_id"])
+        if new_rows < MIN_NEW_ROWS:
+            logger.info("Only %d new fitness rows since %s; keeping it", new_rows, parent["version"])
+            return dict(parent, skipped=True)
+        result = _fit_warm(conn, parent, os.path.join(versions_dir, parent["version"]), n_jobs, chunk_rows)
+    if result is None:
+        result = _fit_full(conn, n_jobs, include_seed, rule_labels, param_grid, chunk_rows)
+    model, encoder, scaler, info, timings = result
+    model.set_params(n_jobs=None)  # callers choose their own (predict_risk_batch n_jobs)
+
+    accuracy = seed_holdout_accuracy(model, encoder, scaler)
+    deployed = deployed_seed_holdout_accuracy(promote_to) if promote_result else None
+    promoted = promote_result and (deployed is None or accuracy >= deployed)
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    version_dir = os.path.join(versions_dir, version)
+    os.makedirs(version_dir)
+    for name, obj in (("model", model), ("encoder", encoder), ("scaler", scaler)):
+        joblib.dump(obj, os.path.join(version_dir, registry.ARTIFACTS[name]))
+
+    metrics = {"version": version, "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               **info, "seed_holdout_accuracy": accuracy, "deployed_seed_holdout_accuracy": deployed,
+               "promoted": promoted, "n_estimators": len(model.estimators_),
+               "timings": {k: round(v, 3) for k, v in dict(timings, total_seconds=time.perf_counter() - started).items()}}
+    with open(os.path.join(version_dir, METRICS_FILE), "w") as f:
+        json.dump(metrics, f, indent=2, default=str)
+    logger.info("Trained risk model %s (%s) in %.1fs, seed holdout accuracy %.4f",
+                version, info["mode"], metrics["timings"]["total_seconds"], accuracy)
+
+    if promoted:
+        promote(version_dir, promote_to)
+    elif promote_result:
+        logger.warning("Not promoting %s: seed holdout accuracy %.4f is below the deployed %.4f",
+                       version, accuracy, deployed)
+    return metrics
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retrain the risk model.")
+    parser.add_argument("--full", action="store_true", help="ignore the previous version and search again")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="cores for CV / fitting (-1 = all)")
+    parser.add_argument("--no-seed", action="store_true", help="leave the seed training split out")
+    parser.add_argument("--rule-labels", action="store_true",
+                        help="also train on fitness_data rows labelled by the agents.risk_ml rules")
+    parser.add_argument("--promote", action="store_true",
+                        help="deploy the version if its seed holdout accuracy does not drop")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = train(full=args.full, n_jobs=args.n_jobs, include_seed=not args.no_seed,
+                   rule_labels=args.rule_labels, promote_result=args.promote)
+    print(json.dumps(result, indent=2, default=str))
@@ -0,0 +1,175 @@
+# scripts/anomalies.py
+"""
+Vital-sign anomaly detection against each user's own baseline.
+
+Every stored sample is scored with a robust z-score per metric:
+
+    z = (value - median) / (IQR / 1.349)
+
+where median and IQR come from the user's previous BASELINE_DAYS days (the
+day itself excluded). Median / IQR ignore the odd spike, so one bad day does
+not hide the next. Samples with fewer than MIN_BASELINE_SAMPLES prior days
+are not scored, and the scale never drops below MIN_SCALE so a user with
+perfectly flat history does not flag every small change.
+
+|z| >= ANOMALY_Z is written to fitness_anomalies (migration 7), one event per
+(user_id, date, metric). db_operations calls detect_anomalies() inside every
+fitness write for the days whose values changed. Only those samples - plus
+the user's later days within BASELINE_DAYS, whose baseline a corrected or
+back-filled day has just moved - are re-scored. fitness_data holds one row
+per user and day, so each baseline is at most BASELINE_DAYS values: they are
+gathered into a (samples x BASELINE_DAYS) matrix with one sorted-index
+lookup and reduced row-wise in NumPy, with no Python loop per sample.
+
+Rescore every day still in fitness_data (events of archived days are kept) with:
+    python -m scripts.anomalies
+"""
+import sqlite3
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from scripts.key_tables import load_key_table
+
+ANOMALY_METRICS = ("steps", "heart_rate", "bp")
+BASELINE_DAYS = 28
+MIN_BASELINE_SAMPLES = 7
+ANOMALY_Z = 3.5
+IQR_TO_SIGMA = 1.349
+MIN_SCALE = {"steps": 500.0, "heart_rate": 3.0, "bp": 3.0}
+# Samples scored per matrix, bounding memory for bulk imports and rescore_all.
+SCORE_CHUNK_SIZE = 20000
+
+_EVENT_COLUMNS = ("user_id", "date", "metric", "value", "baseline", "scale", "z")
+# (user_id, day number) packed into one sortable int64; day numbers stay below 2**23
+_DAY_BITS = 23
+
+
+def _quantiles(ordered: np.ndarray, count: np.ndarray, qs) -> np.ndarray:
+    """
+    Linear-interpolated quantiles (numpy / pandas default) along axis 1 of a
+    row-sorted (n, days, k) array whose NaNs come last; count = non-NaN values
+    per (row, column). Returns shape (len(qs), n, k).
+    """
+    pos = np.asarray(qs, dtype=float)[:, None, None] * np.maximum(count - 1, 0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    sorted_t = np.moveaxis(ordered, 1, 0)                  # (days, n, k)
+    rows, cols = np.indices(count.shape)
+    low, high = sorted_t[lo, rows, cols], sorted_t[hi, rows, cols]
+    return np.where(count > 0, low + (high - low) * (pos - lo), np.nan)
+
+
+def score_samples(packed: np.ndarray, values: np.ndarray, targets: np.ndarray):
+    """
+    Baselines and z-scores for the samples at positions `targets` of a
+    history sorted by `packed` (user_id << _DAY_BITS | day number), with
+    `values` one column per ANOMALY_METRICS. Returns (median, scale, z), each
+    of shape (len(targets), metrics); z is NaN where there is too little history.
+    """
+    # (target, offset) -> position of the user's sample BASELINE_DAYS..1 days earlier
+    wanted = packed[targets][:, None] - np.arange(1, BASELINE_DAYS + 1)
+    pos = np.minimum(np.searchsorted(packed, wanted), len(packed) - 1)
+    window = np.where((packed[pos] == wanted)[:, :, None], values[pos], np.nan)
+
+    count = np.count_nonzero(~np.isnan(window), axis=1)
+    q25, median, q75 = _quantiles(np.sort(window, axis=1), count, (0.25, 0.5, 0.75))
+    floor = np.array([MIN_SCALE.get(m, 1.0) for m in ANOMALY_METRICS])
+    scale = np.maximum(np.nan_to_num((q75 - q25) / IQR_TO_SIGMA, nan=0.0), floor)
+    z = np.where(count >= MIN_BASELINE_SAMPLES, (values[targets] - median) / scale, np.nan)
+    return median, scale, z
+
+
+def detect_anomalies(conn: sqlite3.Connection, keys: Iterable[Tuple[int, str]]) -> int:
+    """
+    Score the given (user_id, date) samples (already written), and the same
+    users' stored days up to BASELINE_DAYS after them, and replace their
+    events in fitness_anomalies. Must run inside the writer's transaction.
+    Returns how many events were recorded.
+    """
+    keys = list(keys)
+    if not keys:
+        return 0
+    load_key_table(conn, "anomaly_keys", ("user_id", "day"), keys)
+
+    # Each user's samples from BASELINE_DAYS before their earliest key to
+    # BASELINE_DAYS after their latest one.
+    cur = conn.execute(f"""
+        WITH spans AS (
+            SELECT user_id, date(MIN(day), '-{int(BASELINE_DAYS)} days') AS lo,
+                   date(MAX(day), '+{int(BASELINE_DAYS)} days') AS hi
+            FROM temp.anomaly_keys GROUP BY user_id
+        )
+        SELECT f.user_id, CAST(julianday(date(f.date)) AS INTEGER), f.date,
+               {', '.join(f'f.{m}' for m in ANOMALY_METRICS)}
+        FROM spans s
+        CROSS JOIN fitness_data f ON f.user_id = s.user_id AND f.date BETWEEN s.lo AND s.hi
+        WHERE date(f.date) IS NOT NULL
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        conn.execute("""
+            DELETE FROM fitness_anomalies
+            WHERE (user_id, date) IN (SELECT user_id, day FROM temp.anomaly_keys)
+        """)
+        return 0
+
+    users = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    dates = [r[2] for r in rows]
+    values = np.array([r[3:] for r in rows], dtype=float)
+    packed = (users << _DAY_BITS) | days
+    order = np.argsort(packed, kind="stable")
+    packed, values, users = packed[order], values[order], users[order]
+    dates = [dates[i] for i in order]
+
+    # Samples to (re)score: the keys, and every later day whose window holds a key.
+    key_set = set(keys)
+    is_key = np.array([(int(u), d) in key_set for u, d in zip(users, dates)])
+    key_packed = packed[is_key]
+    nearest = np.searchsorted(key_packed, packed - BASELINE_DAYS)
+    affected = is_key.copy()
+    inside = nearest < len(key_packed)
+    affected[inside] |= key_packed[nearest[inside]] < packed[inside]
+    targets = np.flatnonzero(affected)
+
+    later: List[Tuple[int, str]] = [(int(users[i]), dates[i]) for i in np.flatnonzero(affected & ~is_key)]
+    conn.executemany("INSERT OR IGNORE INTO temp.anomaly_keys VALUES (?, ?)", later)
+    conn.execute("""
+        DELETE FROM fitness_anomalies
+        WHERE (user_id, date) IN (SELECT user_id, day FROM temp.anomaly_keys)
+    """)
+
+    events = []
+    for start in range(0, len(targets), SCORE_CHUNK_SIZE):
+        chunk = targets[start:start + SCORE_CHUNK_SIZE]
+        median, scale, z = score_samples(packed, values, chunk)
+        with np.errstate(invalid="ignore"):
+            hit_rows, hit_metrics = np.nonzero(np.abs(z) >= ANOMALY_Z)
+        for r, m in zip(hit_rows, hit_metrics):
+            i = chunk[r]
+            events.append((int(users[i]), dates[i], ANOMALY_METRICS[m], float(values[i, m]),
+                           float(median[r, m]), float(scale[r, m]), float(z[r, m])))
+    conn.executemany(f"""
+        INSERT INTO fitness_anomalies ({', '.join(_EVENT_COLUMNS)})
+        VALUES ({', '.join('?' * len(_EVENT_COLUMNS))})
+    """, events)
+    return len(events)
+
+
+def rescore_all(conn: sqlite3.Connection):
+    """
+    Score every day of fitness_data again, replacing its events. Events of
+    days archived out of fitness_data (scripts/archive.py) are kept.
+    """
+    with conn:
+        keys = conn.execute("SELECT user_id, date FROM fitness_data WHERE user_id IS NOT NULL").fetchall()
+        return detect_anomalies(conn, keys)
+
+
+if __name__ == "__main__":
+    from scripts.db_operations import DB_NAME, create_tables, get_connection
+
+    create_tables()
+    found = rescore_all(get_connection())
+    print(f"Rescored {DB_NAME}: {found} anomaly events")
@@ -0,0 +1,180 @@
+# scripts/archive.py
+"""
+Cold storage for old fitness_data rows.
+
+archive_fitness_data() moves rows older than a horizon out of SQLite into
+zstd-compressed Parquet files partitioned per user and month:
+
+    <ARCHIVE_DIR>/user_id=<id>/month=<YYYY-MM>/part-<uuid>-0.parquet
+
+Every row carries the archived_at time of its run. A day that is written
+again after it was archived (a correction or back-fill) and then archived
+once more is in the archive twice; readers keep the copy archived last.
+
+fetch_fitness_history() reads a user's history across both stores: the
+Parquet side only opens that user's partitions for the requested months and
+pushes the date filter down to row-group statistics.
+
+The live table stays small, so backups, VACUUM and index maintenance stay
+cheap. The derived tables keep covering archived days: their rows for those
+days are left as they are, the rebuilds (`python -m scripts.rollups`,
+`scripts.anomalies`) only recompute days still in fitness_data, and
+`python -m scripts.online_stats` replays the archive as well.
+
+Run from cron / a scheduler:
+    python -m scripts.archive [--days 365] [--vacuum]
+"""
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from scripts import db_operations
+from scripts.db_operations import FITNESS_COLUMNS, FITNESS_METRICS, PROJECT_ROOT
+from scripts.feature_store import refresh_risk_features
+
+ARCHIVE_DIR = os.getenv("FITNESS_ARCHIVE_DIR", os.path.join(PROJECT_ROOT, "archive", "fitness_data"))
+ARCHIVE_HORIZON_DAYS = int(os.getenv("FITNESS_ARCHIVE_HORIZON_DAYS", "365"))
+ARCHIVE_BATCH_ROWS = 100000
+
+
+def archive_fitness_data(horizon_days: int = ARCHIVE_HORIZON_DAYS, before: Optional[str] = None,
+                         archive_dir: Optional[str] = None, vacuum: bool = False) -> Dict[str, Any]:
+    """
+    Move fitness_data rows dated before `before` (default: today - horizon_days)
+    to Parquet, then delete them from SQLite.
+    The write lock is held for the whole move, so no row can slip in between
+    the export and the delete. Returns {"archived": n, "cutoff": date}.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    archive_dir = archive_dir or ARCHIVE_DIR
+    conn = db_operations.get_connection()
+    cutoff = before or conn.execute("SELECT date('now', ?)", (f"-{int(horizon_days)} days",)).fetchone()[0]
+
+    archived = 0
+    users = set()
+    archived_at = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur = conn.execute(f"""
+            SELECT {', '.join(FITNESS_COLUMNS)}, substr(date, 1, 7) AS month
+            FROM fitness_data
+            WHERE date < ? AND user_id IS NOT NULL
+            ORDER BY user_id, date
+        """, (cutoff,))
+        names = list(FITNESS_COLUMNS) + ["month"]
+        while True:
+            rows = cur.fetchmany(ARCHIVE_BATCH_ROWS)
+            if not rows:
+                break
+            table = pa.Table.from_pydict({name: [r[i] for r in rows] for i, name in enumerate(names)})
+            table = table.append_column("archived_at", pa.array([archived_at] * len(rows), pa.string()))
+            pq.write_to_dataset(
+                table, archive_dir,
+                partition_cols=["user_id", "month"],
+                basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                compression="zstd",
+            )
+            archived += len(rows)
+            users.update(r[0] for r in rows)
+        conn.execute("DELETE FROM fitness_data WHERE date < ? AND user_id IS NOT NULL", (cutoff,))
+        # a user's latest record may have moved out
+        refresh_risk_features(conn, users)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if vacuum and archived:
+        conn.execute("VACUUM")
+    return {"archived": archived, "cutoff": cutoff}
+
+
+def archived_user_ids(archive_dir: Optional[str] = None) -> List[int]:
+    """Users with at least one archived partition."""
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(int(name.split("=", 1)[1]) for name in os.listdir(archive_dir)
+                  if name.startswith("user_id=") and os.path.isdir(os.path.join(archive_dir, name)))
+
+
+def fetch_archived_fitness(user_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                           columns: Sequence[str] = FITNESS_METRICS, archive_dir: Optional[str] = None):
+    """
+    The user's archived days between start and end (inclusive) as a frame of
+    date (as stored) plus columns, one row per day (the copy archived last).
+    """
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    columns = list(columns)
+    user_dir = os.path.join(archive_dir or ARCHIVE_DIR, f"user_id={int(user_id)}")
+    if not os.path.isdir(user_dir):
+        return pd.DataFrame(columns=["date"] + columns)
+
+    dataset = ds.dataset(user_dir, format="parquet", partitioning="hive")
+    predicate = None
+    for expr in (
+        ds.field("month") >= str(start)[:7] if start is not None else None,
+        ds.field("month") <= str(end)[:7] if end is not None else None,
+        ds.field("date") >= str(start) if start is not None else None,
+        ds.field("date") <= str(end) if end is not None else None,
+    ):
+        if expr is not None:
+            predicate = expr if predicate is None else predicate & expr
+    df = dataset.to_table(columns=["date", "archived_at"] + columns, filter=predicate).to_pandas()
+    df = df.sort_values("archived_at", kind="stable").drop_duplicates(subset="date", keep="last")
+    return df.drop(columns="archived_at").sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def fetch_fitness_history(user_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                          columns: Sequence[str] = FITNESS_METRICS, resample: Optional[str] = None,
+                          archive_dir: Optional[str] = None):
+    """
+    Same contract as db_operations.fetch_fitness_range, but also covers rows
+    that were archived to Parquet. If a day exists in both stores (e.g. an
+    interrupted archive run), the SQLite row wins.
+    """
+    import pandas as pd
+
+    columns = list(columns)
+    hot = db_operations.fetch_fitness_range(user_id, start, end, columns=columns)
+    cold = fetch_archived_fitness(user_id, start, end, columns, archive_dir)
+    if cold.empty:
+        df = hot
+    else:
+        cold["date"] = pd.to_datetime(cold["date"], errors="coerce")
+        df = pd.concat([cold, hot], ignore_index=True)
+        df = df.drop_duplicates(subset="date", keep="last").sort_values("date", kind="stable")
+        df = df.reset_index(drop=True)
+
+    if resample is not None:
+        rule = db_operations.RESAMPLE_RULES[resample]
+        df = df.dropna(subset=["date"]).set_index("date").resample(**rule).mean().reset_index()
+    return df
+
+
+def delete_user_archives(user_ids, archive_dir: Optional[str] = None):
+    """
+    Remove archived partitions for deleted accounts (called by db_operations.purge_users).
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    for user_id in user_ids:
+        shutil.rmtree(os.path.join(archive_dir, f"user_id={int(user_id)}"), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive old fitness_data rows to Parquet.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_HORIZON_DAYS, help="keep this many days in SQLite")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    args = parser.parse_args()
+
+    result = archive_fitness_data(horizon_days=args.days, vacuum=args.vacuum)
+    print(f"Archived {result['archived']} rows dated before {result['cutoff']} to {ARCHIVE_DIR}")
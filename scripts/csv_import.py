@@ -0,0 +1,78 @@
+# scripts/csv_import.py
+"""
+Streaming fitness CSV importer.
+
+Reads the file in fixed-size chunks so memory stays flat regardless of file
+size. Each chunk is validated/coerced in one vectorized step
+(db_operations.coerce_fitness_frame), bad rows are appended to a reject CSV
+instead of aborting the import, and good rows are inserted with
+db_operations.add_fitness_data_many, which skips (user_id, date) pairs that
+already exist - including ones from earlier chunks of the same file.
+"""
+import os
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from scripts.db_operations import add_fitness_data_many, coerce_fitness_frame, fitness_frame_rows
+
+DEFAULT_CHUNK_ROWS = 20000
+
+
+def _source_size(source) -> Optional[int]:
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    size = getattr(source, "size", None)  # Streamlit UploadedFile
+    if size is None and hasattr(source, "seek") and hasattr(source, "tell"):
+        pos = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(pos)
+    return size
+
+
+def import_fitness_csv(source, default_user_id: Optional[int] = None, reject_path: Optional[str] = None,
+                       chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                       on_progress: Optional[Callable[[float, Dict[str, int]], None]] = None) -> Dict[str, Any]:
+    """
+    Import a fitness CSV (path or file-like object) chunk by chunk.
+
+    default_user_id: used for rows without a user_id column/value.
+    reject_path: CSV file that receives rejected rows (with a reject_reason column);
+                 it is created on the first rejected row and overwritten per import.
+    on_progress: called after every chunk with (fraction 0..1, running counts).
+
+    Returns {"rows", "inserted", "duplicates", "rejected", "reject_path"}.
+    """
+    size = _source_size(source)
+    handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    counts = {"rows": 0, "inserted": 0, "duplicates": 0, "rejected": 0}
+    reject_header = True
+
+    try:
+        # dtype=str keeps the raw text for the reject file; coercion happens below.
+        for chunk in pd.read_csv(handle, chunksize=chunk_rows, dtype=str, skipinitialspace=True):
+            counts["rows"] += len(chunk)
+            valid, rejected = coerce_fitness_frame(chunk, default_user_id=default_user_id)
+
+            if len(rejected) and reject_path:
+                rejected.to_csv(reject_path, mode="w" if reject_header else "a",
+                                header=reject_header, index=False)
+                reject_header = False
+            counts["rejected"] += len(rejected)
+
+            # One transaction per chunk: progress is durable and the WAL stays small.
+            result = add_fitness_data_many(fitness_frame_rows(valid))
+            counts["inserted"] += result["inserted"]
+            counts["duplicates"] += result["duplicates"]
+
+            if on_progress:
+                fraction = handle.tell() / size if size else 0.0
+                on_progress(min(1.0, fraction), dict(counts))
+    finally:
+        if handle is not source:
+            handle.close()
+
+    if on_progress:
+        on_progress(1.0, dict(counts))
+    counts["reject_path"] = reject_path if not reject_header else None
+    return counts
@@ -1,52 +1,181 @@
 
+# scripts/db_operations.py
+"""
+The app's single data-access layer. The Streamlit UI, the FastAPI backend
+and the agents all read and write through these functions, so connection
+handling, tuning and caching live in one place.
+
+The database is chosen with DATABASE_URL (env or .env), e.g.
+sqlite:///healthcare.db; relative paths resolve against the project root,
+so every entry point opens the same file whatever its working directory.
+"""
+import logging
+import os
 import sqlite3
-from typing import Optional, List, Dict, Any
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Optional, List, Dict, Any, Iterable, Sequence, Tuple
 
-DB_NAME = "healthcare.db"
+from scripts.anomalies import detect_anomalies
+from scripts.cache import TTLCache
+from scripts.feature_store import FEATURE_COLUMNS, FEATURE_TABLE, refresh_risk_features
+from scripts.migrations import run_migrations
+from scripts.online_stats import ONLINE_METRICS, snapshot, summarise, update_online_stats
+from scripts.rollups import ROLLUP_METRICS, refresh_rollups
 
-def get_connection():
-    return sqlite3.connect(DB_NAME)
+# dotenv (optional)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
 
-def create_tables():
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATABASE_URL = "sqlite:///healthcare.db"
+
+def sqlite_path_from_url(url: str) -> str:
+    """
+    sqlite:///relative.db -> <project root>/relative.db, sqlite:////abs.db -> /abs.db
+    """
+    prefix = "sqlite:///"
+    if not url.startswith(prefix):
+        raise ValueError(f"Only sqlite:/// database URLs are supported, got {url!r}")
+    path = url[len(prefix):]
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(PROJECT_ROOT, path))
+
+DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+DB_NAME = sqlite_path_from_url(DATABASE_URL)
+
+# DB_TRACE=1 logs every SQL statement (debug level) under "db_operations".
+DB_TRACE = os.getenv("DB_TRACE", "") not in ("", "0")
+logger = logging.getLogger("db_operations")
+
+# -------------------- Connection management --------------------
+# Every helper below used to open and close its own sqlite3 connection, so a
+# single Streamlit rerun paid several connect/close cycles. Connections are now
+# long-lived and kept per thread (sqlite3 objects must stay on the thread that
+# created them), one per database file so tests can point DB_NAME elsewhere.
+
+BUSY_TIMEOUT_SECONDS = 5.0
+
+PRAGMAS = (
+    # WAL lets readers keep going while a writer commits.
+    "PRAGMA journal_mode=WAL",
+    # Safe with WAL: only the last transaction can be lost on power failure.
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    # Negative value = size in KiB (here ~16 MB page cache per connection).
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+_local = threading.local()
+
+
+class _PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that survives callers doing conn.close().
+    Older scripts still close what get_connection() gives them; that must not
+    tear down the shared handle the rest of the thread is using.
+    """
+    def close(self):
+        pass
+
+    def really_close(self):
+        super().close()
+
+
+def _open_connection(db_name: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_SECONDS, factory=_PooledConnection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if DB_TRACE:
+        conn.set_trace_callback(logger.debug)
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's long-lived connection to DB_NAME, opening it on first use.
+    """
+    conns = getattr(_local, "connections", None)
+    if conns is None:
+        conns = _local.connections = {}
+    conn = conns.get(DB_NAME)
+    if conn is None:
+        conn = conns[DB_NAME] = _open_connection(DB_NAME)
+    return conn
+
+
+def close_connection():
+    """
+    Close this thread's connections (e.g. on shutdown or between tests).
+    """
+    conns = getattr(_local, "connections", None) or {}
+    for conn in conns.values():
+        conn.really_close()
+    conns.clear()
+
+
+@contextmanager
+def transaction():
+    """
+    Yield the pooled connection inside a transaction: commit on success,
+    roll back on error so a failed write never leaves the shared handle locked.
+    """
     conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            phone TEXT,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL,
-            doctor_id INTEGER,
-            patient_id INTEGER
-        )
-    """)
-    # Add other tables (medications, fitness, etc.)
-    conn.commit()
-    conn.close()
+    with conn:
+        yield conn
+
+def create_tables():
+    """
+    Create or upgrade the schema (tables + indexes) to the latest version.
+    See scripts/migrations.py for the versioned steps.
+    """
+    run_migrations(get_connection())
+
+# -------------------- User functions --------------------
+# Users and doctor/patient relationships are read several times per Streamlit
+# rerun, so they are cached in memory (keyed by database + user id). Every
+# write below invalidates the affected entries; the TTL only bounds staleness
+# from writes made by another process.
+USER_CACHE_TTL_SECONDS = 60
+_user_cache = TTLCache(maxsize=4096, ttl=USER_CACHE_TTL_SECONDS)
+
+def _invalidate_relationships():
+    _user_cache.pop_where(lambda key: key[0] == "patients")
 
 def add_user(name, email, phone, password_hash, role, doctor_id=None, patient_id=None):
     """
     Add a user. Password must already be hashed with bcrypt before passing in.
     """
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO users (name, email, phone, password_hash, role, doctor_id, patient_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (name, email, phone, password_hash, role, doctor_id, patient_id))
-    conn.commit()
-    user_id = c.lastrowid
-    conn.close()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO users (name, email, phone, password_hash, role, doctor_id, patient_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (name, email, phone, password_hash, role, doctor_id, patient_id))
+        user_id = c.lastrowid
+    _user_cache.pop(("user", DB_NAME, user_id))
+    _user_cache.pop(("patients", DB_NAME, doctor_id))
     return user_id
 
+def invalidate_user_cache(user_id: Optional[int] = None):
+    """
+    Drop cached users/relationships (one user, or everything when user_id is None).
+    """
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(("user", DB_NAME, user_id))
+        _invalidate_relationships()
+
 def get_user_by_email(email):
     conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT id, name, email, password_hash, role, doctor_id, patient_id FROM users WHERE email=?", (email,))
     row = c.fetchone()
-    conn.close()
     if row:
         return {
             "id": row[0],
@@ -60,14 +189,19 @@ def get_user_by_email(email):
     return None
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str,Any]]:
+    if user_id is None:
+        return None
+    key = ("user", DB_NAME, user_id)
+    cached = _user_cache.get(key)
+    if cached is not None:
+        return dict(cached)
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, email, phone, role, doctor_id, patient_id FROM users WHERE id = ?", (user_id,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
-    return {
+    user = {
         "id": row[0],
         "name": row[1],
         "email": row[2],
@@ -76,18 +210,73 @@ def get_user_by_id(user_id: int) -> Optional[Dict[str,Any]]:
         "doctor_id": row[5],
         "patient_id": row[6]
     }
+    _user_cache.set(key, user)
+    return dict(user)
 
 def fetch_patients_of_doctor(doctor_user_id: int) -> List[Dict[str,Any]]:
     """
     Returns list of patients assigned to the given doctor id.
     """
+    key = ("patients", DB_NAME, doctor_user_id)
+    cached = _user_cache.get(key)
+    if cached is not None:
+        return [dict(p) for p in cached]
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, email, phone FROM users WHERE role = 'patient' AND doctor_id = ?", (doctor_user_id,))
     rows = cur.fetchall()
-    conn.close()
-    return [{"id": r[0], "name": r[1], "email": r[2], "phone": r[3]} for r in rows]
+    patients = [{"id": r[0], "name": r[1], "email": r[2], "phone": r[3]} for r in rows]
+    _user_cache.set(key, patients)
+    return [dict(p) for p in patients]
+
 
+def fetch_patients_overview(doctor_user_id: int) -> List[Dict[str,Any]]:
+    """
+    Dashboard view of every patient assigned to the doctor, in one query:
+    the patient's contact fields, their latest fitness record (same keys and
+    defaults as fetch_fitness), how many medications they have and the date of
+    the most recent fitness record or prescription ("last_updated").
+    The latest record is picked with MAX(id) per user, which SQLite answers
+    from idx_fitness_data_user_id without reading the rest of the history.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        WITH panel AS (
+            SELECT id, name, email, phone FROM users
+            WHERE role = 'patient' AND doctor_id = ?
+        ),
+        meds AS (
+            SELECT m.user_id, COUNT(*) AS med_count, MAX(date(m.created_at)) AS last_med
+            FROM medications m JOIN panel p ON p.id = m.user_id
+            GROUP BY m.user_id
+        )
+        SELECT p.id, p.name, p.email, p.phone,
+               f.bmi, f.steps, f.sleep, f.calories, f.heart_rate, f.exercise, f.bp, f.date,
+               COALESCE(meds.med_count, 0),
+               CASE WHEN meds.last_med IS NULL OR f.date >= meds.last_med
+                    THEN COALESCE(f.date, meds.last_med) ELSE meds.last_med END
+        FROM panel p
+        LEFT JOIN fitness_data f
+               ON f.id = (SELECT MAX(id) FROM fitness_data WHERE user_id = p.id)
+        LEFT JOIN meds ON meds.user_id = p.id
+        ORDER BY p.name
+    """, (doctor_user_id,))
+    return [{
+        "id": r[0], "name": r[1], "email": r[2], "phone": r[3],
+        "fitness": {
+            "bmi": r[4] or 0.0,
+            "steps": r[5] or 0,
+            "sleep": r[6] or 0.0,
+            "calories": r[7] or 0,
+            "heart_rate": r[8] or 0,
+            "exercise": r[9] or 0.0,
+            "bp": r[10] or 0,
+            "date": r[11] or ""
+        },
+        "medication_count": r[12],
+        "last_updated": r[13] or ""
+    } for r in cur.fetchall()]
 
 # -------------------- Medication functions --------------------
 
@@ -96,34 +285,25 @@ def add_medication(user_id: int, med_name: str, schedule: str, created_by: Optio
     Add medication record for patient user_id.
     created_by should normally be doctor's user_id.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO medications (user_id, med_name, schedule, notes, created_by)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, med_name, schedule, notes, created_by))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO medications (user_id, med_name, schedule, notes, created_by)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, med_name, schedule, notes, created_by))
 
 def update_medication(med_id: int, med_name: str, schedule: str, notes: str="", edited_by: Optional[int]=None) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE medications
-        SET med_name = ?, schedule = ?, notes = ?, created_by = ?
-        WHERE id = ?
-    """, (med_name, schedule, notes, edited_by, med_id))
-    changed = cur.rowcount
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        cur = conn.execute("""
+            UPDATE medications
+            SET med_name = ?, schedule = ?, notes = ?, created_by = ?
+            WHERE id = ?
+        """, (med_name, schedule, notes, edited_by, med_id))
+        changed = cur.rowcount
     return changed > 0
 
 def delete_medication(med_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM medications WHERE id = ?", (med_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM medications WHERE id = ?", (med_id,))
 
 def fetch_medications(user_id: int, requester_id: Optional[int]=None, requester_role: Optional[str]=None):
     """
@@ -138,83 +318,291 @@ def fetch_medications(user_id: int, requester_id: Optional[int]=None, requester_
         WHERE user_id = ?
         ORDER BY id DESC
     """, (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return cur.fetchall()
 
-def delete_user_and_related(user_id: int):
+def search_medications(term: str, limit: int = 1) -> List[Tuple[str, str, str]]:
     """
-    Deletes a user and related rows in a safe way.
-    Only touches tables we know about in this file:
-      - medications (user_id)
-      - fitness_data (user_id)
-      - goals (user_id)  [optional]
-      - users (id)
-    Any missing table/column is silently ignored.
+    Case-insensitive substring search on medication names.
+    Returns list of tuples (med_name, schedule, notes).
     """
-    conn = get_connection()      
+    conn = get_connection()
     cur = conn.cursor()
+    cur.execute("""
+        SELECT med_name, schedule, notes FROM medications
+        WHERE LOWER(med_name) LIKE ?
+        LIMIT ?
+    """, (f"%{term.lower()}%", limit))
+    return cur.fetchall()
 
-    def safe_delete(sql, params):
-        try:
-            cur.execute(sql, params)
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass   
+# -------------------- Account deletion --------------------
+# Every table holding rows owned by a user, with the column that stores the
+# user's id. Deleting a user deletes these rows in the same transaction. This
+# is the one list: a migration that adds a per-user table adds it here too.
+USER_OWNED_TABLES: List[Tuple[str, str]] = [
+    ("medications", "user_id"),
+    ("fitness_data", "user_id"),
+    ("goals", "user_id"),
+    ("fitness_daily_rollup", "user_id"),
+    ("fitness_weekly_rollup", "user_id"),
+    ("fitness_online_stats", "user_id"),
+    ("user_data_versions", "user_id"),
+    ("fitness_anomalies", "user_id"),
+    ("risk_features", "user_id"),
+    ("fitness_data_dupes", "user_id"),   # rows set aside by migration 3
+]
+# Columns that point at another user (doctor / patient assignment); these are
+# cleared, not deleted, when the referenced user goes away.
+USER_REFERENCE_COLUMNS: List[Tuple[str, str]] = [
+    ("users", "doctor_id"),
+    ("users", "patient_id"),
+]
 
-    # Delete medications belonging to this user
-    safe_delete("DELETE FROM medications WHERE user_id = ?", (user_id,))
+PURGE_CHUNK_SIZE = 500
 
-    # Delete fitness data
-    safe_delete("DELETE FROM fitness_data WHERE user_id = ?", (user_id,))
+def _id_chunks(ids: Sequence[int], chunk_size: int) -> Iterable[Tuple[List[int], str]]:
+    """
+    (chunk, "?, ?, ...") pairs for WHERE col IN (...) statements over ids,
+    chunk_size ids at a time (keeps each statement under SQLite's variable limit).
+    """
+    for start in range(0, len(ids), chunk_size):
+        chunk = list(ids[start:start + chunk_size])
+        yield chunk, ", ".join("?" * len(chunk))
 
-    # Delete goals if exists
-    safe_delete("DELETE FROM goals WHERE user_id = ?", (user_id,))
+def purge_users(user_ids: Iterable[int], chunk_size: int = PURGE_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Delete many users and everything they own in one transaction, using
+    set-based DELETE ... WHERE col IN (...) statements per chunk of ids.
+    USER_OWNED_TABLES entries that do not exist in this database are
+    skipped; any other error rolls the whole purge back.
+    Returns deleted row counts per table (plus "users").
+    """
+    ids = list(dict.fromkeys(int(i) for i in user_ids))
+    counts: Dict[str, int] = {table: 0 for table, _ in USER_OWNED_TABLES}
+    counts["users"] = 0
+    if not ids:
+        return counts
 
-    # Finally delete main user record
-    safe_delete("DELETE FROM users WHERE id = ?", (user_id,))
+    with transaction() as conn:
+        existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for chunk, marks in _id_chunks(ids, chunk_size):
+            for table, column in USER_OWNED_TABLES:
+                if table in existing:
+                    cur = conn.execute(f"DELETE FROM {table} WHERE {column} IN ({marks})", chunk)
+                    counts[table] += cur.rowcount
+            for table, column in USER_REFERENCE_COLUMNS:
+                conn.execute(f"UPDATE {table} SET {column} = NULL WHERE {column} IN ({marks})", chunk)
+            cur = conn.execute(f"DELETE FROM users WHERE id IN ({marks})", chunk)
+            counts["users"] += cur.rowcount
+    # Other users' assignments may have been cleared too; start the cache over.
+    _user_cache.clear()
+    # Archived (Parquet) history belongs to the account as well.
+    from scripts.archive import delete_user_archives
+    delete_user_archives(ids)
+    return counts
 
-    conn.close()
+def delete_user_and_related(user_id: int) -> Dict[str, int]:
+    """
+    Deletes a user and all related rows (see USER_OWNED_TABLES) atomically:
+    either everything goes or nothing does.
+    Returns deleted row counts per table.
+    """
+    return purge_users([user_id])
 
 
 # -------------------- Fitness functions --------------------
+# fitness_data holds one record per user per day: (user_id, date) is unique
+# (uq_fitness_data_user_date), so every write is a single upsert statement.
+
+# Column order shared by add_fitness_data and the bulk helpers below.
+FITNESS_COLUMNS = ("user_id", "bmi", "steps", "sleep", "calories", "heart_rate", "exercise", "bp", "date")
+FITNESS_INT_COLUMNS = ("steps", "calories", "heart_rate", "bp")
+FITNESS_FLOAT_COLUMNS = ("bmi", "sleep", "exercise")
+
+BULK_CHUNK_SIZE = 5000
+
+_UPSERT_FITNESS = """
+    INSERT INTO fitness_data (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        bmi = excluded.bmi, steps = excluded.steps, sleep = excluded.sleep,
+        calories = excluded.calories, heart_rate = excluded.heart_rate,
+        exercise = excluded.exercise, bp = excluded.bp
+"""
+_INSERT_FITNESS_IF_NEW = """
+    INSERT INTO fitness_data (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO NOTHING
+"""
+
+def _after_fitness_write(conn: sqlite3.Connection, rows: Sequence[Sequence[Any]],
+                         before: Dict[Tuple[int, str], Tuple]):
+    """
+    Keep derived data in step with fitness_data. Called inside the writer's
+    transaction with the rows (FITNESS_COLUMNS order) that were just written
+    and the online-stats snapshot of their keys taken before the write.
+    """
+    keys = [(row[0], row[8]) for row in rows]
+    refresh_rollups(conn, keys)
+    after = snapshot(conn, keys)
+    update_online_stats(conn, before, after)
+    detect_anomalies(conn, [key for key in after if before.get(key) != after[key]])
+    refresh_risk_features(conn, {row[0] for row in rows})
+    conn.executemany("""
+        INSERT INTO user_data_versions (user_id, fitness_version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET fitness_version = fitness_version + 1
+    """, [(user_id,) for user_id in {row[0] for row in rows}])
+
+def _write_fitness(conn: sqlite3.Connection, sql: str, rows: Sequence[Sequence[Any]]) -> int:
+    """
+    Run one of the fitness write statements over rows and update derived data.
+    Returns the number of rows inserted or updated.
+    """
+    before = snapshot(conn, [(row[0], row[8]) for row in rows])
+    cur = conn.executemany(sql, rows)
+    _after_fitness_write(conn, rows, before)
+    return cur.rowcount
 
 def add_fitness_data(user_id: int, bmi: float, steps: int, sleep: float, calories: int,
                      heart_rate: int, exercise: float, bp: int, date: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO fitness_data (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date))
-    conn.commit()
-    conn.close()
+    """
+    Store the user's fitness record for `date`, replacing one already saved for that day.
+    """
+    row = (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
+    with transaction() as conn:
+        _write_fitness(conn, _UPSERT_FITNESS, [row])
+
+def add_fitness_data_many(rows: Iterable[Sequence[Any]], skip_duplicates: bool = True,
+                          chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Insert many fitness rows in one transaction using chunked executemany.
+    rows: iterable of tuples in FITNESS_COLUMNS order (same order as add_fitness_data).
+    With skip_duplicates, rows whose (user_id, date) already exists - in the table
+    or earlier in this batch - are left alone and counted as duplicates;
+    otherwise they overwrite the stored record (see update_latest_fitness_many).
+    Returns {"inserted": n, "duplicates": n}.
+    """
+    sql = _INSERT_FITNESS_IF_NEW if skip_duplicates else _UPSERT_FITNESS
+    rows = iter(rows)
+    total = inserted = 0
+    with transaction() as conn:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            total += len(chunk)
+            inserted += _write_fitness(conn, sql, chunk)
+    return {"inserted": inserted, "duplicates": total - inserted}
+
+def coerce_fitness_frame(data, default_user_id: Optional[int] = None):
+    """
+    Validate and type raw fitness rows (DataFrame or iterable of dicts) in one
+    vectorized pass.
+    Missing metric columns default to 0, blank cells become 0, and user_id falls
+    back to default_user_id. Dates may mix formats (ISO, 01/06/2025, ...). Rows
+    with a non-numeric metric, no usable user_id or an unparseable date are rejected.
+    Returns (valid, rejected): valid has FITNESS_COLUMNS with int/float dtypes and
+    ISO dates; rejected holds the original rows plus a "reject_reason" column.
+    """
+    import pandas as pd
+
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(list(data))
+    df = df.reset_index(drop=True)
+    out = pd.DataFrame(index=df.index)
+    reasons = pd.Series("", index=df.index, dtype=object)
+
+    def reject(mask, reason):
+        nonlocal reasons
+        reasons = reasons.mask(mask, reasons + reason + ";")
+
+    if "user_id" in df:
+        uid = pd.to_numeric(df["user_id"], errors="coerce")
+        if default_user_id is not None:
+            uid = uid.fillna(default_user_id)
+    else:
+        uid = pd.Series(default_user_id, index=df.index, dtype="float64")
+    reject(uid.isna() | (uid % 1 != 0), "user_id")
+    out["user_id"] = uid
+
+    for col in FITNESS_FLOAT_COLUMNS + FITNESS_INT_COLUMNS:
+        if col in df:
+            values = pd.to_numeric(df[col], errors="coerce")
+            reject(values.isna() & df[col].notna(), col)
+            out[col] = values.fillna(0)
+        else:
+            out[col] = 0
+
+    if "date" in df:
+        # ISO dates parse in one vectorized pass; anything else (e.g. 01/06/2025)
+        # is parsed per value rather than rejected for not matching the first row.
+        dates = pd.to_datetime(df["date"], format="ISO8601", errors="coerce")
+        retry = dates.isna() & df["date"].notna()
+        if retry.any():
+            dates[retry] = pd.to_datetime(df.loc[retry, "date"], format="mixed", errors="coerce")
+        reject(dates.isna(), "date")
+        out["date"] = dates.dt.strftime("%Y-%m-%d")
+    else:
+        reject(pd.Series(True, index=df.index), "date")
+        out["date"] = None
+
+    ok = reasons == ""
+    valid = out.loc[ok, list(FITNESS_COLUMNS)].astype(
+        {"user_id": "int64", **{c: "int64" for c in FITNESS_INT_COLUMNS},
+         **{c: "float64" for c in FITNESS_FLOAT_COLUMNS}}
+    )
+    rejected = df.loc[~ok].assign(reject_reason=reasons[~ok].str.rstrip(";"))
+    return valid, rejected
+
+def fitness_frame_rows(valid) -> Iterable[tuple]:
+    """
+    Turn a coerced fitness DataFrame into tuples for add_fitness_data_many.
+    tolist() hands sqlite3 plain Python ints/floats instead of NumPy scalars.
+    """
+    return zip(*(valid[col].tolist() for col in FITNESS_COLUMNS))
+
+def bulk_import_fitness(data, default_user_id: Optional[int] = None, skip_duplicates: bool = True,
+                        chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Coerce and insert a batch of fitness rows (DataFrame or iterable of dicts).
+    Returns {"inserted", "duplicates", "rejected"} counts plus "rejected_rows"
+    (DataFrame of the rows that failed validation).
+    """
+    valid, rejected = coerce_fitness_frame(data, default_user_id=default_user_id)
+    result = add_fitness_data_many(fitness_frame_rows(valid), skip_duplicates=skip_duplicates,
+                                   chunk_size=chunk_size)
+    result["rejected"] = len(rejected)
+    result["rejected_rows"] = rejected
+    return result
 
 def update_latest_fitness(user_id: int, bmi: float, steps: int, sleep: float, calories: int,
                           heart_rate: int, exercise: float, bp: int, date: str) -> bool:
     """
-    Update the latest fitness_data record for the user. If none exists, create a new one.
+    Save the user's fitness record for `date`: updates that day's record if one
+    exists, otherwise creates it. A single atomic upsert, so concurrent saves
+    cannot race between a lookup and the write.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM fitness_data WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,))
-    row = cur.fetchone()
-    if row:
-        fid = row[0]
-        cur.execute("""
-            UPDATE fitness_data
-            SET bmi=?, steps=?, sleep=?, calories=?, heart_rate=?, exercise=?, bp=?, date=?
-            WHERE id=?
-        """, (bmi, steps, sleep, calories, heart_rate, exercise, bp, date, fid))
-        changed = cur.rowcount
-        conn.commit()
-        conn.close()
-        return changed > 0
-    else:
-        conn.commit()
-        conn.close()
-        add_fitness_data(user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
-        return True
+    row = (user_id, bmi, steps, sleep, calories, heart_rate, exercise, bp, date)
+    with transaction() as conn:
+        return _write_fitness(conn, _UPSERT_FITNESS, [row]) > 0
+
+def update_latest_fitness_many(rows: Iterable[Sequence[Any]], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Batch form of update_latest_fitness for device syncs covering many users/days.
+    rows: tuples in FITNESS_COLUMNS order. All rows are upserted in one transaction.
+    Returns the number of rows written.
+    """
+    result = add_fitness_data_many(rows, skip_duplicates=False, chunk_size=chunk_size)
+    return result["inserted"]
+
+def get_fitness_version(user_id: int) -> int:
+    """
+    Counter bumped (in the same transaction) by every write to the user's
+    fitness_data, from any process. Caches of derived results compare it
+    instead of expiring on a timer. 0 if the user never had fitness data.
+    """
+    row = get_connection().execute(
+        "SELECT fitness_version FROM user_data_versions WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
 
 def fetch_fitness(user_id: int) -> Dict[str, Any]:
     """
@@ -231,7 +619,6 @@ def fetch_fitness(user_id: int) -> Dict[str, Any]:
         ORDER BY id DESC LIMIT 1
     """, (user_id,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return {
             "bmi": 0.0, "steps": 0, "sleep": 0.0, "calories": 0,
@@ -247,3 +634,217 @@ def fetch_fitness(user_id: int) -> Dict[str, Any]:
         "bp": row[6] or 0,
         "date": row[7] or ""
     }
+
+FITNESS_METRICS = ("bmi", "steps", "sleep", "calories", "heart_rate", "exercise", "bp")
+
+LATEST_CHUNK_SIZE = 500
+
+def fetch_risk_features(user_ids: Optional[Iterable[int]] = None, chunk_size: int = LATEST_CHUNK_SIZE):
+    """
+    Precomputed model-ready vectors (scripts/feature_store.py) for many users,
+    or every user with data when user_ids is None: primary key lookups only.
+    Returns a pandas DataFrame: user_id, FEATURE_COLUMNS (the model's feature
+    names), date - one row per user that has data.
+    """
+    import pandas as pd
+
+    select = f"SELECT user_id, {', '.join(FEATURE_COLUMNS)}, date FROM {FEATURE_TABLE}"
+    conn = get_connection()
+    if user_ids is None:
+        rows = conn.execute(select).fetchall()
+    else:
+        ids = list(dict.fromkeys(int(i) for i in user_ids))
+        rows = []
+        for chunk, marks in _id_chunks(ids, chunk_size):
+            rows += conn.execute(f"{select} WHERE user_id IN ({marks})", chunk).fetchall()
+    return pd.DataFrame.from_records(rows, columns=["user_id"] + list(FEATURE_COLUMNS) + ["date"])
+
+def fetch_risk_feature_vector(user_id: int) -> Optional[Tuple[float, ...]]:
+    """
+    The user's precomputed vector in FEATURE_COLUMNS order, or None without data.
+    """
+    row = get_connection().execute(
+        f"SELECT {', '.join(FEATURE_COLUMNS)} FROM {FEATURE_TABLE} WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return tuple(row) if row else None
+
+RESAMPLE_RULES = {
+    "day": {"rule": "D"},
+    # ISO weeks: labelled by the Monday they start on
+    "week": {"rule": "W-MON", "label": "left", "closed": "left"},
+}
+
+def fetch_fitness_range(user_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                        columns: Sequence[str] = FITNESS_METRICS, resample: Optional[str] = None):
+    """
+    Return a user's fitness history between start and end (inclusive ISO dates,
+    either may be None) as a pandas DataFrame with a datetime "date" column
+    followed by the requested metric columns, oldest first.
+    The frame is built straight from cursor.fetchall() (no per-row dicts) and the
+    query is served by uq_fitness_data_user_date.
+    resample: None, "day" or "week" - mean per calendar day / ISO week.
+    """
+    import pandas as pd
+
+    columns = list(columns)
+    unknown = set(columns) - set(FITNESS_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown fitness columns: {sorted(unknown)}")
+    if resample is not None and resample not in RESAMPLE_RULES:
+        raise ValueError(f"resample must be one of {sorted(RESAMPLE_RULES)} or None")
+
+    sql = f"SELECT {', '.join(['date'] + columns)} FROM fitness_data WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start is not None:
+        sql += " AND date >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND date <= ?"
+        params.append(str(end))
+    sql += " ORDER BY date, id"
+
+    cur = get_connection().execute(sql, params)
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=["date"] + columns)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df[columns] = df[columns].apply(pd.to_numeric, errors="coerce")
+
+    if resample is not None:
+        df = df.dropna(subset=["date"]).set_index("date")
+        df = df.resample(**RESAMPLE_RULES[resample]).mean().reset_index()
+    return df
+
+ROLLUP_PERIODS = {"day": ("fitness_daily_rollup", "day"), "week": ("fitness_weekly_rollup", "week_start")}
+
+def fetch_fitness_rollup(user_id: int, period: str = "day", start: Optional[str] = None,
+                         end: Optional[str] = None, metrics: Sequence[str] = ROLLUP_METRICS):
+    """
+    Read pre-aggregated fitness stats (see scripts/rollups.py) instead of raw rows.
+    period: "day" or "week" (weeks are keyed by their Monday; start/end compare
+    against that key). Returns a pandas DataFrame with "date", "n" and, per
+    metric, <m>_sum / <m>_min / <m>_max / <m>_mean columns, oldest first.
+    """
+    import pandas as pd
+
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"period must be one of {sorted(ROLLUP_PERIODS)}")
+    metrics = list(metrics)
+    unknown = set(metrics) - set(ROLLUP_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown rollup metrics: {sorted(unknown)}")
+    table, key = ROLLUP_PERIODS[period]
+
+    columns = ["date", "n"] + [f"{m}_{agg}" for m in metrics for agg in ("sum", "min", "max")]
+    sql = f"SELECT {key}, n{''.join(f', {c}' for c in columns[2:])} FROM {table} WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start is not None:
+        sql += f" AND {key} >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += f" AND {key} <= ?"
+        params.append(str(end))
+    sql += f" ORDER BY {key}"
+
+    cur = get_connection().execute(sql, params)
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+    df["date"] = pd.to_datetime(df["date"])
+    for m in metrics:
+        df[f"{m}_mean"] = df[f"{m}_sum"] / df["n"]
+    return df
+
+PANEL_LATEST_COLUMNS = ("steps", "heart_rate", "bp", "sleep")
+
+def fetch_panel_fitness_stats(doctor_user_id: int, start: Optional[str] = None,
+                              metrics: Sequence[str] = ROLLUP_METRICS):
+    """
+    One row per patient of the doctor, computed in a single grouped query over
+    the daily rollups (so archived days still count): "days" with data since
+    `start`, <m>_mean / <m>_min / <m>_max per metric, and the latest raw record
+    as latest_<m> plus latest_date. Patients without data get NaN / None.
+    Returns a pandas DataFrame ordered by name.
+    """
+    import pandas as pd
+
+    metrics = list(metrics)
+    unknown = set(metrics) - set(ROLLUP_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown rollup metrics: {sorted(unknown)}")
+
+    stat_columns = [f"{m}_{agg}" for m in metrics for agg in ("mean", "min", "max")]
+    aggregates = "".join(
+        f", 1.0 * SUM(r.{m}_sum) / SUM(r.n) AS {m}_mean, MIN(r.{m}_min) AS {m}_min, MAX(r.{m}_max) AS {m}_max"
+        for m in metrics
+    )
+    day_filter = "AND r.day >= ?" if start is not None else ""
+    params: List[Any] = ([str(start)] if start is not None else []) + [doctor_user_id]
+    cur = get_connection().execute(f"""
+        WITH panel AS (
+            SELECT p.id, p.name, COALESCE(SUM(r.n), 0) AS days{aggregates}
+            FROM users p
+            LEFT JOIN fitness_daily_rollup r ON r.user_id = p.id {day_filter}
+            WHERE p.role = 'patient' AND p.doctor_id = ?
+            GROUP BY p.id
+        )
+        SELECT p.id, p.name, p.days{''.join(f', p.{c}' for c in stat_columns)},
+               {', '.join(f'f.{c}' for c in PANEL_LATEST_COLUMNS)}, f.date
+        FROM panel p
+        LEFT JOIN fitness_data f
+               ON f.id = (SELECT MAX(id) FROM fitness_data WHERE user_id = p.id)
+        ORDER BY p.name
+    """, params)
+
+    columns = (["id", "name", "days"] + stat_columns
+               + [f"latest_{c}" for c in PANEL_LATEST_COLUMNS] + ["latest_date"])
+    df = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+    numeric = stat_columns + [f"latest_{c}" for c in PANEL_LATEST_COLUMNS]
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors="coerce")
+    return df
+
+def fetch_online_stats(user_id: int, metrics: Sequence[str] = ONLINE_METRICS,
+                       values: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Running statistics per metric for the user (see scripts/online_stats.py),
+    read from one small row per metric instead of the raw history:
+    {metric: {"n", "mean", "std", "ewma", "ewm_std", "prev_ewma", "prev_ewm_std",
+    "last", "last_date", "z"}}. "last" / "last_date" are the latest day that
+    has the metric (a NULL reading is not one), and prev_* the recent baseline
+    before it. "z" scores values[metric] if given, else the latest day, against
+    the recent (EWMA) baseline. Metrics without data are left out.
+    """
+    metrics = list(metrics)
+    unknown = set(metrics) - set(ONLINE_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown online metrics: {sorted(unknown)}")
+    cur = get_connection().execute(f"""
+        SELECT metric, n, mean, m2, ewma, ewm_var, prev_ewma, prev_ewm_var, last_value, last_date
+        FROM fitness_online_stats
+        WHERE user_id = ? AND metric IN ({', '.join('?' * len(metrics))})
+    """, [user_id] + metrics)
+    values = values or {}
+    stats = {}
+    for metric, *row in cur.fetchall():
+        state = dict(zip(("n", "mean", "m2", "ewma", "ewm_var", "prev_ewma", "prev_ewm_var",
+                          "last_value", "last_date"), row))
+        value = values.get(metric)
+        stats[metric] = summarise(state, float(value) if value is not None else None)
+    return {m: stats[m] for m in metrics if m in stats}
+
+def fetch_anomalies(user_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Anomaly events for the user (see scripts/anomalies.py), newest day first:
+    [{"date", "metric", "value", "baseline", "z"}, ...].
+    """
+    sql = "SELECT date, metric, value, baseline, z FROM fitness_anomalies WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if start is not None:
+        sql += " AND date >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND date <= ?"
+        params.append(str(end))
+    sql += " ORDER BY date DESC, metric"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = get_connection().execute(sql, params)
+    return [dict(zip(("date", "metric", "value", "baseline", "z"), r)) for r in cur.fetchall()]
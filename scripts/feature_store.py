@@ -0,0 +1,76 @@
+# scripts/feature_store.py
+"""
+Model-ready risk feature vectors, one row per user (risk_features, migration 8).
+
+Each row is the user's latest fitness_data record (same MAX(id) rule as
+db_operations.fetch_fitness) already renamed and ordered the way the risk
+model was trained (models.registry.FEATURES), with NULLs stored as 0 like
+fetch_fitness returns them:
+
+    risk_features column       fitness_data column
+    BMI                        bmi
+    Daily_Steps                steps
+    Calories_Intake            calories
+    Hours_of_Sleep             sleep
+    Heart_Rate                 heart_rate
+    Systolic_BP                bp
+    Exercise_Hours_per_Week    exercise   (hours per week in both)
+
+plus fitness_id / date of the source record. The mapping is
+models.registry.FITNESS_FEATURES. Scoring reads a vector with one primary
+key lookup (db_operations.fetch_risk_features) instead of rebuilding it.
+
+db_operations calls refresh_risk_features() for the users touched by every
+fitness write, inside the same transaction, and archive_fitness_data() for
+the users whose rows it moved. Rebuild everything with:
+    python -m scripts.feature_store
+"""
+import sqlite3
+from typing import Iterable
+
+from models.registry import FEATURES, FITNESS_FEATURES
+from scripts.key_tables import load_key_table
+
+FEATURE_TABLE = "risk_features"
+FEATURE_COLUMNS = FEATURES
+
+_VECTOR_SQL = ", ".join(f"COALESCE(f.{FITNESS_FEATURES[c]}, 0)" for c in FEATURE_COLUMNS)
+
+
+def refresh_risk_features(conn: sqlite3.Connection, user_ids: Iterable[int]):
+    """
+    Recompute the vectors of the given users from fitness_data; users left
+    without records lose theirs. Must run inside the writer's transaction.
+    """
+    load_key_table(conn, "feature_users", ("user_id",), [(u,) for u in user_ids if u is not None])
+    conn.execute(f"DELETE FROM {FEATURE_TABLE} WHERE user_id IN (SELECT user_id FROM temp.feature_users)")
+    conn.execute(f"""
+        INSERT INTO {FEATURE_TABLE} (user_id, fitness_id, date, {', '.join(FEATURE_COLUMNS)})
+        SELECT f.user_id, f.id, f.date, {_VECTOR_SQL}
+        FROM temp.feature_users k
+        CROSS JOIN fitness_data f ON f.id = (SELECT MAX(id) FROM fitness_data WHERE user_id = k.user_id)
+    """)
+
+
+def rebuild_risk_features(conn: sqlite3.Connection):
+    """
+    Drop and recompute every vector from fitness_data.
+    """
+    with conn:
+        conn.execute(f"DELETE FROM {FEATURE_TABLE}")
+        conn.execute(f"""
+            INSERT INTO {FEATURE_TABLE} (user_id, fitness_id, date, {', '.join(FEATURE_COLUMNS)})
+            SELECT f.user_id, f.id, f.date, {_VECTOR_SQL}
+            FROM fitness_data f
+            JOIN (SELECT MAX(id) AS id FROM fitness_data WHERE user_id IS NOT NULL GROUP BY user_id) l
+              ON f.id = l.id
+        """)
+
+
+if __name__ == "__main__":
+    from scripts.db_operations import DB_NAME, create_tables, get_connection
+
+    create_tables()
+    rebuild_risk_features(get_connection())
+    count = get_connection().execute(f"SELECT COUNT(*) FROM {FEATURE_TABLE}").fetchone()[0]
+    print(f"Rebuilt risk features in {DB_NAME}: {count} users")
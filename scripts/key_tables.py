@@ -0,0 +1,37 @@
+# scripts/key_tables.py
+"""
+Temporary key tables for per-key work on fitness_data and the tables derived
+from it (rollups, online stats, anomalies, risk features).
+
+A writer that touched a set of (user_id, date) keys - or user ids - loads
+them with load_key_table() and joins the table with CROSS JOIN ... ON.
+SQLite has no statistics on temp tables, and CROSS JOIN pins the key table
+as the outer loop, so every key is one index probe into the large table
+instead of whatever scan the planner might pick. Tables are emptied on each
+load and belong to the connection, so use one within a single transaction.
+
+This lives outside db_operations because the modules using it are imported
+by db_operations.
+"""
+import sqlite3
+from typing import Iterable, Sequence
+
+# SQL type of every key column in use
+KEY_COLUMN_TYPES = {"user_id": "INTEGER", "day": "TEXT", "week_start": "TEXT"}
+
+
+def load_key_table(conn: sqlite3.Connection, name: str, columns: Sequence[str],
+                   rows: Iterable[Sequence] = ()) -> str:
+    """
+    Create (once per connection) and empty the TEMP table `name` keyed on
+    `columns`, insert rows (duplicates ignored) and return "temp.<name>".
+    """
+    definitions = ", ".join(f"{c} {KEY_COLUMN_TYPES[c]}" for c in columns)
+    conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {name} (
+            {definitions}, PRIMARY KEY ({', '.join(columns)})
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"DELETE FROM temp.{name}")
+    conn.executemany(f"INSERT OR IGNORE INTO temp.{name} VALUES ({', '.join('?' * len(columns))})", rows)
+    return f"temp.{name}"
@@ -0,0 +1,118 @@
+# scripts/merge_legacy_db.py
+"""
+One-off merge of the old health_data.db into the app database.
+
+Before db_operations became the single data-access layer, the FastAPI
+server and the chatbot read health_data.db in the project root; everything
+now reads db_operations.DB_NAME (healthcare.db by default), so the users,
+medications and vitals only stored in the old file have to be copied over:
+
+    python -m scripts.merge_legacy_db [--source health_data.db]
+
+- users are matched by email: existing accounts are kept as they are, new
+  ones are inserted and their doctor_id / patient_id links remapped to the
+  new ids.
+- medications are copied for the merged users, skipping (user, name,
+  schedule) entries the target already has, so repeated legacy entries
+  collapse into one and running the merge twice adds nothing.
+- fitness_data rows are mapped onto the current columns (sleep_hours ->
+  sleep, systolic_bp -> bp; calories_burned, diastolic_bp and temperature
+  have no column and are dropped) and added with add_fitness_data_many, so
+  days the user already has are left alone.
+
+The source file is opened read-only and never changed.
+"""
+import os
+import sqlite3
+import sys
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts import db_operations
+
+LEGACY_DB = os.path.join(db_operations.PROJECT_ROOT, "health_data.db")
+# legacy fitness_data column -> current fitness_data column
+LEGACY_FITNESS_COLUMNS = {"steps": "steps", "sleep_hours": "sleep", "heart_rate": "heart_rate",
+                          "systolic_bp": "bp", "date": "date"}
+
+
+def _rows(conn: sqlite3.Connection, table: str) -> List[Dict]:
+    """All rows of table as dicts; [] when the legacy file has no such table."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+        return []
+    cur = conn.execute(f"SELECT * FROM {table} ORDER BY id")
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur]
+
+
+def merge_legacy_db(source: str = LEGACY_DB) -> Dict[str, int]:
+    """
+    Copy users, medications and fitness_data from the legacy database at
+    source into db_operations.DB_NAME. Returns counts of what was added and
+    of users that already existed.
+    """
+    legacy = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        users, medications, fitness = (_rows(legacy, t) for t in ("users", "medications", "fitness_data"))
+    finally:
+        legacy.close()
+
+    db_operations.create_tables()
+    counts = {"users": 0, "existing_users": 0, "medications": 0, "fitness_data": 0}
+    id_map = {}
+    with db_operations.transaction() as conn:
+        new_users = []
+        for user in users:
+            if not user.get("email"):
+                continue
+            row = conn.execute("SELECT id FROM users WHERE email = ?", (user["email"],)).fetchone()
+            if row:
+                id_map[user["id"]] = row[0]
+                counts["existing_users"] += 1
+                continue
+            cur = conn.execute("""
+                INSERT INTO users (name, email, password_hash, role) VALUES (?, ?, ?, ?)
+            """, (user.get("name"), user["email"], user.get("password_hash"), user.get("role")))
+            id_map[user["id"]] = cur.lastrowid
+            new_users.append(user)
+            counts["users"] += 1
+        for user in new_users:
+            conn.execute("UPDATE users SET doctor_id = ?, patient_id = ? WHERE id = ?",
+                         (id_map.get(user.get("doctor_id")), id_map.get(user.get("patient_id")), id_map[user["id"]]))
+
+        for med in medications:
+            user_id = id_map.get(med.get("user_id"))
+            if user_id is None:
+                continue
+            key = (user_id, med.get("med_name"), med.get("schedule"))
+            if conn.execute("""
+                SELECT 1 FROM medications WHERE user_id = ? AND med_name IS ? AND schedule IS ?
+            """, key).fetchone():
+                continue
+            conn.execute("INSERT INTO medications (user_id, med_name, schedule) VALUES (?, ?, ?)", key)
+            counts["medications"] += 1
+
+    fitness_rows = []
+    for record in fitness:
+        user_id = id_map.get(record.get("user_id"))
+        if user_id is None or not record.get("date"):
+            continue
+        values = {new: record.get(old) for old, new in LEGACY_FITNESS_COLUMNS.items()}
+        fitness_rows.append((user_id, None, values["steps"], values["sleep"], None, values["heart_rate"],
+                             None, values["bp"], values["date"]))
+    counts["fitness_data"] = db_operations.add_fitness_data_many(fitness_rows)["inserted"]
+    db_operations.invalidate_user_cache()
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the legacy health_data.db into the app database.")
+    parser.add_argument("--source", default=LEGACY_DB, help="legacy database file")
+    args = parser.parse_args()
+
+    result = merge_legacy_db(args.source)
+    print(f"Merged {args.source} into {db_operations.DB_NAME}: {result['users']} users "
+          f"({result['existing_users']} already there), {result['medications']} medications, "
+          f"{result['fitness_data']} fitness records")
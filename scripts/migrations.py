@@ -0,0 +1,265 @@
+# scripts/migrations.py
+"""
+Versioned schema migrations for the app database (healthcare.db).
+
+The current version lives in SQLite's built-in PRAGMA user_version, so no
+extra bookkeeping table is needed. Each entry in MIGRATIONS runs once, in
+order, inside its own transaction. To change the schema, append a new
+(version, description, statements) entry - never edit one that has shipped.
+A statement is SQL or a callable taking the connection (for checks and
+logging that SQL alone cannot do).
+"""
+import logging
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Metrics rolled up by migration 4 (frozen here; see scripts/rollups.py).
+_V4_ROLLUP_METRICS = ("steps", "calories", "heart_rate", "sleep", "bp")
+_V4_ROLLUP_COLUMNS = "".join(
+    f"{m}_sum REAL, {m}_min REAL, {m}_max REAL, " for m in _V4_ROLLUP_METRICS
+)
+_V4_NAMES = ", ".join(f"{m}_sum, {m}_min, {m}_max" for m in _V4_ROLLUP_METRICS)
+
+# Metrics tracked by migration 5 (frozen here; see scripts/online_stats.py).
+_V5_ONLINE_METRICS = ("steps", "heart_rate", "bp")
+# Seed from existing rows: exact count / mean / M2; the EWMA starts at the mean.
+_V5_BACKFILL = " UNION ALL ".join(f"""
+    SELECT a.user_id, '{m}', a.n, a.mean, SUM((f.{m} - a.mean) * (f.{m} - a.mean)) AS m2,
+           a.mean, SUM((f.{m} - a.mean) * (f.{m} - a.mean)) / a.n,
+           a.mean, SUM((f.{m} - a.mean) * (f.{m} - a.mean)) / a.n,
+           (SELECT l.{m} FROM fitness_data l WHERE l.user_id = a.user_id AND l.date = a.last_date), a.last_date
+    FROM (SELECT user_id, COUNT({m}) AS n, AVG({m}) AS mean, MAX(date) AS last_date
+          FROM fitness_data WHERE user_id IS NOT NULL AND date IS NOT NULL AND {m} IS NOT NULL
+          GROUP BY user_id) a
+    JOIN fitness_data f ON f.user_id = a.user_id AND f.date IS NOT NULL AND f.{m} IS NOT NULL
+    GROUP BY a.user_id
+""" for m in _V5_ONLINE_METRICS)
+
+# risk_features columns of migration 8 and their fitness_data source (frozen
+# here; see scripts/feature_store.py).
+_V8_FEATURE_SOURCES = (
+    ("BMI", "bmi"), ("Daily_Steps", "steps"), ("Calories_Intake", "calories"),
+    ("Hours_of_Sleep", "sleep"), ("Heart_Rate", "heart_rate"), ("Systolic_BP", "bp"),
+    ("Exercise_Hours_per_Week", "exercise"),
+)
+
+def _log_fitness_dupes(conn: sqlite3.Connection):
+    moved = conn.execute("SELECT COUNT(*) FROM fitness_data_dupes").fetchone()[0]
+    if moved:
+        logger.warning("Migration 3 moved %d duplicate fitness_data rows to fitness_data_dupes", moved)
+
+
+Statement = Union[str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Tuple[int, str, Tuple[Statement, ...]]] = [
+    (1, "core tables", (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            phone TEXT,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            doctor_id INTEGER,
+            patient_id INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS medications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            med_name TEXT,
+            schedule TEXT,
+            notes TEXT,
+            created_by INTEGER,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS fitness_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bmi REAL,
+            steps INTEGER,
+            sleep REAL,
+            calories INTEGER,
+            heart_rate INTEGER,
+            exercise REAL,
+            bp INTEGER,
+            date TEXT,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+        """,
+    )),
+    (2, "indexes for hot query paths", (
+        # fetch_fitness: WHERE user_id = ? ORDER BY id DESC LIMIT 1
+        "CREATE INDEX IF NOT EXISTS idx_fitness_data_user_id ON fitness_data(user_id, id)",
+        # date-range reads per user
+        "CREATE INDEX IF NOT EXISTS idx_fitness_data_user_date ON fitness_data(user_id, date)",
+        # fetch_medications: WHERE user_id = ? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_medications_user_id ON medications(user_id, id)",
+        # fetch_patients_of_doctor: WHERE role = 'patient' AND doctor_id = ?
+        "CREATE INDEX IF NOT EXISTS idx_users_doctor_role ON users(doctor_id, role)",
+        # caregiver -> patient lookups
+        "CREATE INDEX IF NOT EXISTS idx_users_patient_id ON users(patient_id)",
+    )),
+    (3, "one fitness record per user per day", (
+        # Keep only the newest row of any (user_id, date) duplicates so the
+        # unique index can be built; writes then upsert on that key. The
+        # older copies are kept in fitness_data_dupes, not dropped. Rows with a
+        # NULL user_id or date never collide in the index, so they stay.
+        "CREATE TABLE IF NOT EXISTS fitness_data_dupes AS SELECT * FROM fitness_data WHERE 0",
+        """
+        INSERT INTO fitness_data_dupes
+        SELECT * FROM fitness_data
+        WHERE user_id IS NOT NULL AND date IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM fitness_data
+            WHERE user_id IS NOT NULL AND date IS NOT NULL
+            GROUP BY user_id, date
+        )
+        """,
+        "DELETE FROM fitness_data WHERE id IN (SELECT id FROM fitness_data_dupes)",
+        _log_fitness_dupes,
+        "DROP INDEX IF EXISTS idx_fitness_data_user_date",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_fitness_data_user_date ON fitness_data(user_id, date)",
+    )),
+    (4, "daily and weekly fitness rollups", (
+        f"""
+        CREATE TABLE IF NOT EXISTS fitness_daily_rollup (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            {_V4_ROLLUP_COLUMNS}
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS fitness_weekly_rollup (
+            user_id INTEGER NOT NULL,
+            week_start TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            {_V4_ROLLUP_COLUMNS}
+            PRIMARY KEY (user_id, week_start)
+        ) WITHOUT ROWID
+        """,
+        # Backfill from existing rows
+        f"""
+        INSERT OR REPLACE INTO fitness_daily_rollup (user_id, day, n, {_V4_NAMES})
+        SELECT user_id, date, COUNT(*), {", ".join(f"SUM({m}), MIN({m}), MAX({m})" for m in _V4_ROLLUP_METRICS)}
+        FROM fitness_data
+        WHERE user_id IS NOT NULL AND date(date) IS NOT NULL
+        GROUP BY user_id, date
+        """,
+        f"""
+        INSERT OR REPLACE INTO fitness_weekly_rollup (user_id, week_start, n, {_V4_NAMES})
+        SELECT user_id, date(day, 'weekday 0', '-6 days') AS week_start, SUM(n),
+               {", ".join(f"SUM({m}_sum), MIN({m}_min), MAX({m}_max)" for m in _V4_ROLLUP_METRICS)}
+        FROM fitness_daily_rollup
+        GROUP BY user_id, week_start
+        """,
+    )),
+    (5, "online per-user statistics", (
+        """
+        CREATE TABLE IF NOT EXISTS fitness_online_stats (
+            user_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            ewma REAL,
+            ewm_var REAL,
+            prev_ewma REAL,
+            prev_ewm_var REAL,
+            last_value REAL,
+            last_date TEXT,
+            PRIMARY KEY (user_id, metric)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        INSERT OR REPLACE INTO fitness_online_stats
+            (user_id, metric, n, mean, m2, ewma, ewm_var, prev_ewma, prev_ewm_var, last_value, last_date)
+        {_V5_BACKFILL}
+        """,
+    )),
+    (6, "per-user data versions", (
+        """
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id INTEGER PRIMARY KEY,
+            fitness_version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    )),
+    # Filled on ingest; run `python -m scripts.anomalies` to score older rows.
+    (7, "vital-sign anomaly events", (
+        """
+        CREATE TABLE IF NOT EXISTS fitness_anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL,
+            baseline REAL,
+            scale REAL,
+            z REAL NOT NULL,
+            detected_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, date, metric)
+        )
+        """,
+    )),
+    (8, "per-user risk feature store", (
+        f"""
+        CREATE TABLE IF NOT EXISTS risk_features (
+            user_id INTEGER PRIMARY KEY,
+            fitness_id INTEGER NOT NULL,
+            date TEXT,
+            {''.join(f"{name} REAL NOT NULL, " for name, _ in _V8_FEATURE_SOURCES)}
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        f"""
+        INSERT OR REPLACE INTO risk_features (user_id, fitness_id, date, {', '.join(n for n, _ in _V8_FEATURE_SOURCES)})
+        SELECT f.user_id, f.id, f.date, {', '.join(f"COALESCE(f.{c}, 0)" for _, c in _V8_FEATURE_SOURCES)}
+        FROM fitness_data f
+        JOIN (SELECT MAX(id) AS id FROM fitness_data WHERE user_id IS NOT NULL GROUP BY user_id) l
+          ON f.id = l.id
+        """,
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Bring the database up to LATEST_VERSION and return the resulting version.
+    Cheap when already current: a single PRAGMA read.
+    """
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return get_schema_version(conn)
+
+    for version, description, statements in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes
+        # starting at once cannot both apply the same step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
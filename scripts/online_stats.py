@@ -0,0 +1,186 @@
+# scripts/online_stats.py
+"""
+Running per-user statistics for the key vitals, maintained on ingest so
+readers get a mean / standard deviation / z-score without scanning history.
+
+fitness_online_stats (migration 5) holds one row per (user_id, metric) with:
+- n, mean, m2: Welford accumulators over every stored day. Because a day can
+  be corrected, a replaced value is first removed (Welford in reverse) and the
+  new one added, so these stay exact.
+- ewma, ewm_var: exponentially weighted mean / variance (span EWMA_SPAN_DAYS)
+  - the "recent" baseline. They follow days in date order: re-saving the
+  latest day replaces its contribution (prev_ewma / prev_ewm_var keep the state
+  before it), while back-filled older days only touch the Welford part.
+- last_value, last_date: the most recent day seen.
+
+db_operations calls snapshot() before and update_online_stats() after every
+fitness write, inside the same transaction; each changed sample costs O(1).
+
+Replay everything from raw data (fitness_data and the Parquet archive) with:
+    python -m scripts.online_stats
+"""
+import math
+import sqlite3
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from scripts.key_tables import load_key_table
+
+ONLINE_METRICS = ("steps", "heart_rate", "bp")
+EWMA_SPAN_DAYS = 14
+EWMA_ALPHA = 2.0 / (EWMA_SPAN_DAYS + 1)
+
+_STATE_COLUMNS = ("n", "mean", "m2", "ewma", "ewm_var", "prev_ewma", "prev_ewm_var", "last_value", "last_date")
+
+Key = Tuple[int, str]
+
+
+def snapshot(conn: sqlite3.Connection, keys: Iterable[Key]) -> Dict[Key, Tuple]:
+    """
+    Current ONLINE_METRICS values of fitness_data for the given (user_id, date)
+    keys; keys without a stored row are left out.
+    """
+    keys_table = load_key_table(conn, "online_stats_keys", ("user_id", "day"), keys)
+    cur = conn.execute(f"""
+        SELECT f.user_id, f.date, {', '.join(f'f.{m}' for m in ONLINE_METRICS)}
+        FROM {keys_table} k
+        CROSS JOIN fitness_data f ON f.user_id = k.user_id AND f.date = k.day
+    """)
+    return {(r[0], r[1]): r[2:] for r in cur}
+
+
+def _remove(state: Dict[str, Any], x: float):
+    n = state["n"]
+    if n <= 1:
+        state.update(n=0, mean=0.0, m2=0.0)
+        return
+    mean = (n * state["mean"] - x) / (n - 1)
+    state["m2"] = max(0.0, state["m2"] - (x - state["mean"]) * (x - mean))
+    state.update(n=n - 1, mean=mean)
+
+
+def _add(state: Dict[str, Any], x: float):
+    n = state["n"] + 1
+    delta = x - state["mean"]
+    mean = state["mean"] + delta / n
+    state["m2"] += delta * (x - mean)
+    state.update(n=n, mean=mean)
+
+
+def _ewm_add(state: Dict[str, Any], day: str, x: float):
+    last_date = state["last_date"]
+    if last_date is not None and day < last_date:
+        return                       # back-fill: too old to move the recent baseline
+    if last_date is not None and day == last_date:
+        ewma, ewm_var = state["prev_ewma"], state["prev_ewm_var"]
+    else:
+        ewma, ewm_var = state["ewma"], state["ewm_var"]
+    state.update(prev_ewma=ewma, prev_ewm_var=ewm_var, last_value=x, last_date=day)
+    if ewma is None:
+        state.update(ewma=x, ewm_var=0.0)
+        return
+    diff = x - ewma
+    incr = EWMA_ALPHA * diff
+    state.update(ewma=ewma + incr, ewm_var=(1 - EWMA_ALPHA) * (ewm_var + diff * incr))
+
+
+def update_online_stats(conn: sqlite3.Connection, before: Dict[Key, Tuple], after: Dict[Key, Tuple]):
+    """
+    Fold the difference between two snapshots into fitness_online_stats:
+    values that disappeared or changed are removed, new ones added, unchanged
+    keys (e.g. skipped duplicates) cost nothing. Must run inside the writer's
+    transaction.
+    """
+    changed = sorted(k for k in after if before.get(k) != after[k])
+    if not changed:
+        return
+
+    wanted = {(user_id, m) for user_id, _ in changed for m in ONLINE_METRICS}
+    states: Dict[Tuple[int, str], Dict[str, Any]] = {}
+    for user_id in {user_id for user_id, _ in changed}:
+        for row in conn.execute(
+            f"SELECT metric, {', '.join(_STATE_COLUMNS)} FROM fitness_online_stats WHERE user_id = ?",
+            (user_id,),
+        ):
+            states[(user_id, row[0])] = dict(zip(_STATE_COLUMNS, row[1:]))
+    for key in wanted:
+        states.setdefault(key, {"n": 0, "mean": 0.0, "m2": 0.0, "ewma": None, "ewm_var": None,
+                                "prev_ewma": None, "prev_ewm_var": None,
+                                "last_value": None, "last_date": None})
+
+    for user_id, day in changed:
+        old, new = before.get((user_id, day)), after[(user_id, day)]
+        for i, m in enumerate(ONLINE_METRICS):
+            state = states[(user_id, m)]
+            if old is not None and old[i] is not None:
+                _remove(state, float(old[i]))
+            if new[i] is not None:
+                _add(state, float(new[i]))
+                _ewm_add(state, day, float(new[i]))
+
+    conn.executemany(f"""
+        INSERT OR REPLACE INTO fitness_online_stats (user_id, metric, {', '.join(_STATE_COLUMNS)})
+        VALUES (?, ?{', ?' * len(_STATE_COLUMNS)})
+    """, [(user_id, m, *(states[(user_id, m)][c] for c in _STATE_COLUMNS)) for user_id, m in wanted])
+
+
+def summarise(state: Dict[str, Any], value: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Reader view of one stored row: all-time mean / std, recent (EWMA) mean /
+    std, the recent baseline before the latest day (prev_ewma / prev_ewm_std,
+    which the latest value is not part of), and the z-score of `value`
+    (default: the latest day) against the recent baseline. Undefined values
+    are None.
+    """
+    n = state["n"]
+    std = math.sqrt(state["m2"] / (n - 1)) if n > 1 else None
+    ewm_std = math.sqrt(state["ewm_var"]) if state["ewm_var"] is not None else None
+    prev_var = state.get("prev_ewm_var")
+    prev_ewm_std = math.sqrt(prev_var) if prev_var is not None else None
+    value = state["last_value"] if value is None else value
+    z = None
+    if value is not None and state["ewma"] is not None and ewm_std:
+        z = (value - state["ewma"]) / ewm_std
+    return {"n": n, "mean": state["mean"] if n else None, "std": std,
+            "ewma": state["ewma"], "ewm_std": ewm_std,
+            "prev_ewma": state.get("prev_ewma"), "prev_ewm_std": prev_ewm_std,
+            "last": state["last_value"], "last_date": state["last_date"], "z": z}
+
+
+def rebuild_online_stats(conn: sqlite3.Connection, archive_dir: Optional[str] = None):
+    """
+    Drop and recompute every row by replaying each user's days in date order:
+    fitness_data plus the days archived to Parquet (scripts/archive.py), the
+    fitness_data row winning for a day held in both.
+    """
+    import pandas as pd
+    from scripts import archive  # archive imports db_operations, which imports this module
+
+    archived = archive.archived_user_ids(archive_dir)
+    sql = f"""
+        SELECT user_id, date, {', '.join(ONLINE_METRICS)} FROM fitness_data
+        WHERE user_id IS NOT NULL AND date IS NOT NULL
+    """
+    with conn:
+        conn.execute("DELETE FROM fitness_online_stats")
+        cur = conn.execute(sql + " ORDER BY user_id, date")
+        skip = set(archived)
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            update_online_stats(conn, {}, {(r[0], r[1]): r[2:] for r in rows if r[0] not in skip})
+        for user_id in archived:
+            cold = archive.fetch_archived_fitness(user_id, columns=ONLINE_METRICS, archive_dir=archive_dir)
+            days = {r[0]: tuple(None if pd.isna(v) else v for v in r[1:])
+                    for r in cold.itertuples(index=False)}
+            days.update((r[1], r[2:]) for r in conn.execute(sql + " AND user_id = ?", (user_id,)))
+            update_online_stats(conn, {}, {(user_id, day): values for day, values in days.items()})
+
+
+if __name__ == "__main__":
+    from scripts.db_operations import DB_NAME, create_tables, get_connection
+
+    create_tables()
+    rebuild_online_stats(get_connection())
+    count = get_connection().execute("SELECT COUNT(*) FROM fitness_online_stats").fetchone()[0]
+    print(f"Rebuilt online stats in {DB_NAME}: {count} rows")
@@ -0,0 +1,113 @@
+# scripts/rollups.py
+"""
+Pre-aggregated fitness rollups per user: one row per day
+(fitness_daily_rollup) and one per ISO week (fitness_weekly_rollup, keyed by
+the Monday the week starts on). Each row stores count plus sum / min / max
+of ROLLUP_METRICS, so "last 90 days" style questions read a few dozen rows
+instead of rescanning fitness_data.
+
+The tables are created by migration 4 (scripts/migrations.py) and kept
+current by db_operations: every fitness write calls refresh_rollups() for
+the (user_id, date) keys it touched, inside the same transaction. Only the
+touched days and their weeks are recomputed, which stays correct for
+updates as well as inserts.
+
+Rebuild from raw data with:
+    python -m scripts.rollups
+"""
+import sqlite3
+from typing import Iterable, Tuple
+
+from scripts.key_tables import load_key_table
+
+ROLLUP_METRICS = ("steps", "calories", "heart_rate", "sleep", "bp")
+
+# SQLite: Monday on or before `day` (weekday 0 = next Sunday, then back 6 days)
+WEEK_START_SQL = "date({col}, 'weekday 0', '-6 days')"
+
+_DAY_AGGREGATES = ", ".join(
+    f"SUM({m}), MIN({m}), MAX({m})" for m in ROLLUP_METRICS
+)
+_WEEK_AGGREGATES = ", ".join(
+    f"SUM({m}_sum), MIN({m}_min), MAX({m}_max)" for m in ROLLUP_METRICS
+)
+_ROLLUP_COLUMNS = ", ".join(
+    f"{m}_sum, {m}_min, {m}_max" for m in ROLLUP_METRICS
+)
+
+
+def refresh_rollups(conn: sqlite3.Connection, keys: Iterable[Tuple[int, str]]):
+    """
+    Recompute the daily and weekly rollups for the given (user_id, date) keys.
+    Must run inside the caller's transaction so rollups commit with the data.
+    """
+    load_key_table(conn, "rollup_days", ("user_id", "day"), keys)
+    load_key_table(conn, "rollup_weeks", ("user_id", "week_start"))
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.rollup_weeks
+        SELECT user_id, {WEEK_START_SQL.format(col='day')} FROM temp.rollup_days
+        WHERE {WEEK_START_SQL.format(col='day')} IS NOT NULL
+    """)
+
+    conn.execute("""
+        DELETE FROM fitness_daily_rollup
+        WHERE (user_id, day) IN (SELECT user_id, day FROM temp.rollup_days)
+    """)
+    conn.execute(f"""
+        INSERT INTO fitness_daily_rollup (user_id, day, n, {_ROLLUP_COLUMNS})
+        SELECT f.user_id, f.date, COUNT(*), {_DAY_AGGREGATES}
+        FROM temp.rollup_days k
+        CROSS JOIN fitness_data f ON f.user_id = k.user_id AND f.date = k.day
+        GROUP BY f.user_id, f.date
+    """)
+
+    conn.execute("""
+        DELETE FROM fitness_weekly_rollup
+        WHERE (user_id, week_start) IN (SELECT user_id, week_start FROM temp.rollup_weeks)
+    """)
+    conn.execute(f"""
+        INSERT INTO fitness_weekly_rollup (user_id, week_start, n, {_ROLLUP_COLUMNS})
+        SELECT w.user_id, w.week_start, SUM(d.n), {_WEEK_AGGREGATES}
+        FROM temp.rollup_weeks w
+        CROSS JOIN fitness_daily_rollup d
+          ON d.user_id = w.user_id AND d.day BETWEEN w.week_start AND date(w.week_start, '+6 days')
+        GROUP BY w.user_id, w.week_start
+    """)
+
+
+def rebuild_rollups(conn: sqlite3.Connection):
+    """
+    Recompute the daily rollups of every day fitness_data holds, then every
+    weekly rollup from the daily ones (one pass each). Daily rows of days
+    that were archived out of fitness_data (scripts/archive.py) are kept, so
+    those days still count in their weeks.
+    """
+    with conn:
+        conn.execute("""
+            DELETE FROM fitness_daily_rollup
+            WHERE (user_id, day) IN (SELECT user_id, date FROM fitness_data WHERE user_id IS NOT NULL)
+        """)
+        conn.execute("DELETE FROM fitness_weekly_rollup")
+        conn.execute(f"""
+            INSERT INTO fitness_daily_rollup (user_id, day, n, {_ROLLUP_COLUMNS})
+            SELECT user_id, date, COUNT(*), {_DAY_AGGREGATES}
+            FROM fitness_data
+            WHERE user_id IS NOT NULL AND date(date) IS NOT NULL
+            GROUP BY user_id, date
+        """)
+        conn.execute(f"""
+            INSERT INTO fitness_weekly_rollup (user_id, week_start, n, {_ROLLUP_COLUMNS})
+            SELECT user_id, {WEEK_START_SQL.format(col='day')} AS week_start, SUM(n), {_WEEK_AGGREGATES}
+            FROM fitness_daily_rollup
+            GROUP BY user_id, week_start
+        """)
+
+
+if __name__ == "__main__":
+    from scripts.db_operations import DB_NAME, create_tables, get_connection
+
+    create_tables()
+    rebuild_rollups(get_connection())
+    days, weeks = (get_connection().execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                   for t in ("fitness_daily_rollup", "fitness_weekly_rollup"))
+    print(f"Rebuilt rollups in {DB_NAME}: {days} daily rows, {weeks} weekly rows")
@@ -1,7 +1,11 @@
 # scripts/setup_db.py
+import os
 import sqlite3
+import sys
 
-DB_NAME = "healthcare.db"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.db_operations import DB_NAME
+from scripts.migrations import run_migrations
 
 def reset_database():
     conn = sqlite3.connect(DB_NAME)
@@ -11,54 +15,23 @@ def reset_database():
     cur.execute("DROP TABLE IF EXISTS fitness_data")
     cur.execute("DROP TABLE IF EXISTS medications")
     cur.execute("DROP TABLE IF EXISTS users")
+    # Derived tables, rebuilt empty by the migrations
+    cur.execute("DROP TABLE IF EXISTS fitness_daily_rollup")
+    cur.execute("DROP TABLE IF EXISTS fitness_weekly_rollup")
+    cur.execute("DROP TABLE IF EXISTS fitness_online_stats")
+    cur.execute("DROP TABLE IF EXISTS user_data_versions")
+    cur.execute("DROP TABLE IF EXISTS fitness_anomalies")
+    cur.execute("DROP TABLE IF EXISTS risk_features")
+    cur.execute("DROP TABLE IF EXISTS fitness_data_dupes")
+    cur.execute("PRAGMA user_version = 0")
+    conn.commit()
 
     print("Recreating tables...")
-    # Recreate using same schema as db_operations.create_tables
-    cur.execute("""
-    CREATE TABLE users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        email TEXT UNIQUE,
-        phone TEXT,
-        password TEXT,
-        role TEXT,
-        doctor_id INTEGER,
-        patient_id INTEGER,
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE medications (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        med_name TEXT,
-        schedule TEXT,
-        notes TEXT,
-        created_by INTEGER,
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
+    # Same versioned migrations db_operations.create_tables runs
+    version = run_migrations(conn)
 
-    cur.execute("""
-    CREATE TABLE fitness_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        bmi REAL,
-        steps INTEGER,
-        sleep REAL,
-        calories INTEGER,
-        heart_rate INTEGER,
-        exercise REAL,
-        bp INTEGER,
-        date TEXT,
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
-
-    conn.commit()
     conn.close()
-    print("Reset complete.")
+    print(f"Reset complete (schema version {version}).")
 
 if __name__ == "__main__":
     reset_database()
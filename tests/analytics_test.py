@@ -9,7 +9,8 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the functions we need to test
-from agents.analytics_agent import get_analytics, cal_avg_steps, analyse_calories, classify_heart_rate
+import pandas as pd
+from agents.analytics_agent import get_analytics, cal_avg_steps, analyse_calories, classify_heart_rate, compute_fitness_analytics, clear_analytics_cache
 from agents.health_chatbot import process_health_query, CHATBOT_CACHE
 
 
@@ -39,14 +40,36 @@ def test_classify_heart_rate_normal():
     status = classify_heart_rate(MOCK_DB_FITNESS_DATA)
     assert status == "Normal"
 
-@patch('agents.analytics_agent.db_operations')
-def test_get_analytics_structure(mock_db_ops):
+@patch('agents.analytics_agent.db_operations.get_fitness_version', return_value=0)
+@patch('agents.analytics_agent.db_operations.fetch_anomalies', return_value=[])
+@patch('agents.analytics_agent.db_operations.fetch_online_stats', return_value={})
+@patch('agents.analytics_agent.fetch_fitness_history')
+def test_get_analytics_structure(mock_history, mock_online, mock_anomalies, mock_version):
     """Validates the main get_analytics function by mocking the DB call."""
-    mock_db_ops.fetch_fitness.return_value = MOCK_DB_FITNESS_DATA
-    insights = get_analytics()
+    clear_analytics_cache()
+    mock_history.return_value = pd.DataFrame(MOCK_DB_FITNESS_DATA)
+    insights = get_analytics(1)
     assert isinstance(insights, dict)
     assert insights['average_steps'] == 8000.0
     assert insights['heart_rate_status'] == "Normal"
+    mock_history.assert_called_once_with(1, start=None)
+
+def test_compute_fitness_analytics_vectorized_summary():
+    """Percentiles, rolling means, trend and goal attainment for every metric."""
+    data = pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=40, freq="D"),
+        "steps": [1000 + 100 * i for i in range(40)],
+        "heart_rate": [70] * 40,
+    })
+    out = compute_fitness_analytics(data, goals={"steps": 3000})
+    steps = out["metrics"]["steps"]
+    assert out["days"] == 40 and out["start"] == "2025-01-01" and out["end"] == "2025-02-09"
+    assert steps["p50"] == 2950.0
+    assert steps["rolling_7d"] == 4600.0
+    assert steps["rolling_30d"] == 3450.0
+    assert abs(steps["trend_per_day"] - 100.0) < 1e-9
+    assert out["metrics"]["heart_rate"]["trend_per_day"] == 0.0
+    assert out["goals"]["steps"] == {"target": 3000, "attainment": 0.5}
 
 
 #  3. TESTS FOR CHATBOT CORE (Week 2/3 Integration) 
@@ -0,0 +1,557 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from scripts import archive, db_operations, migrations
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Point db_operations at a fresh, fully migrated database file."""
+    monkeypatch.setattr(db_operations, "DB_NAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    db_operations.create_tables()
+    yield db_operations
+    db_operations.close_connection()
+
+
+def test_connection_is_reused_and_in_wal_mode(temp_db):
+    conn = temp_db.get_connection()
+    assert temp_db.get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_close_by_caller_keeps_shared_connection_usable(temp_db):
+    temp_db.get_connection().close()
+    uid = temp_db.add_user("Pat", "pat@example.com", "1", "hash", "patient")
+    assert temp_db.get_user_by_id(uid)["email"] == "pat@example.com"
+
+
+def test_failed_write_is_rolled_back(temp_db):
+    temp_db.add_user("Pat", "pat@example.com", "1", "hash", "patient")
+    with pytest.raises(Exception):
+        temp_db.add_user("Dup", "pat@example.com", "1", "hash", "patient")
+    assert not temp_db.get_connection().in_transaction
+
+
+def test_update_latest_fitness_inserts_then_updates(temp_db):
+    uid = temp_db.add_user("Pat", "pat@example.com", "1", "hash", "patient")
+    assert temp_db.update_latest_fitness(uid, 22.0, 4000, 7.0, 1800, 70, 2.0, 120, "2025-01-01")
+    assert temp_db.update_latest_fitness(uid, 22.0, 6000, 7.0, 1800, 70, 2.0, 120, "2025-01-01")
+    assert temp_db.fetch_fitness(uid)["steps"] == 6000
+    count = temp_db.get_connection().execute("SELECT COUNT(*) FROM fitness_data").fetchone()[0]
+    assert count == 1
+
+
+def test_update_latest_fitness_many_upserts_per_user_and_day(temp_db):
+    temp_db.add_fitness_data(1, 22.0, 1000, 7.0, 1800, 70, 1.0, 120, "2025-01-01")
+    written = temp_db.update_latest_fitness_many([
+        (1, 22.0, 4000, 7.0, 1800, 70, 1.0, 120, "2025-01-01"),
+        (1, 22.0, 5000, 7.0, 1800, 70, 1.0, 120, "2025-01-02"),
+        (2, 25.0, 3000, 6.0, 2000, 80, 0.5, 130, "2025-01-01"),
+    ])
+    assert written == 3
+    rows = temp_db.get_connection().execute(
+        "SELECT user_id, date, steps FROM fitness_data ORDER BY user_id, date").fetchall()
+    assert rows == [(1, "2025-01-01", 4000), (1, "2025-01-02", 5000), (2, "2025-01-01", 3000)]
+
+
+def test_migration_collapses_duplicate_days(tmp_path, caplog):
+    import sqlite3
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    for version, _, statements in migrations.MIGRATIONS[:2]:
+        for sql in statements:
+            conn.execute(sql)
+    conn.execute("PRAGMA user_version = 2")
+    conn.executemany("INSERT INTO fitness_data (user_id, steps, date) VALUES (?, ?, ?)",
+                     [(1, 100, "2025-01-01"), (1, 200, "2025-01-01"), (1, 300, "2025-01-02"),
+                      (1, 400, None), (1, 500, None), (None, 600, "2025-01-01"), (None, 700, "2025-01-01")])
+    conn.commit()
+    with caplog.at_level("WARNING", logger="scripts.migrations"):
+        assert migrations.run_migrations(conn) == migrations.LATEST_VERSION
+    assert conn.execute("SELECT steps FROM fitness_data ORDER BY steps").fetchall() == [
+        (200,), (300,), (400,), (500,), (600,), (700,)]
+    assert conn.execute("SELECT steps FROM fitness_data_dupes").fetchall() == [(100,)]
+    assert "moved 1 duplicate" in caplog.text
+    conn.close()
+
+
+def test_migrations_record_version_and_are_idempotent(temp_db):
+    conn = temp_db.get_connection()
+    assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+    assert migrations.run_migrations(conn) == migrations.LATEST_VERSION
+
+
+@pytest.mark.parametrize("sql, params, index", [
+    ("SELECT id FROM fitness_data WHERE user_id = ? ORDER BY id DESC LIMIT 1", (1,), "idx_fitness_data_user_id"),
+    ("SELECT id FROM medications WHERE user_id = ? ORDER BY id DESC", (1,), "idx_medications_user_id"),
+    ("SELECT id FROM users WHERE role = 'patient' AND doctor_id = ?", (1,), "idx_users_doctor_role"),
+    ("SELECT BMI, Daily_Steps FROM risk_features WHERE user_id = ?", (1,), "INTEGER PRIMARY KEY"),
+])
+def test_hot_queries_use_indexes(temp_db, sql, params, index):
+    plan = " ".join(row[-1] for row in temp_db.get_connection().execute("EXPLAIN QUERY PLAN " + sql, params))
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_bulk_import_counts_inserted_duplicates_and_rejected(temp_db):
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({
+        "user_id": [1, 1, 1, 2, "x"],
+        "date": ["2025-01-01", "2025-01-02", "2025-01-01", "2025-01-01", "2025-01-03"],
+        "steps": [1000, 2000, 3000, "lots", 10],
+        "heart_rate": [70, 72, None, 80, 60],
+    })
+    result = temp_db.bulk_import_fitness(df, chunk_size=2)
+    assert (result["inserted"], result["duplicates"], result["rejected"]) == (2, 1, 2)
+    assert set(result["rejected_rows"]["reject_reason"]) == {"steps", "user_id"}
+    latest = temp_db.fetch_fitness(1)
+    assert latest["steps"] == 2000 and latest["bmi"] == 0.0
+
+    again = temp_db.bulk_import_fitness(df)
+    assert again["inserted"] == 0 and again["duplicates"] == 3
+
+
+def test_coerce_fitness_frame_accepts_mixed_date_formats(temp_db):
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"user_id": [1, 1, 1, 1],
+                       "date": ["2025-01-05", "01/06/2025", "Jan 7 2025", "someday"]})
+    valid, rejected = temp_db.coerce_fitness_frame(df)
+    assert valid["date"].tolist() == ["2025-01-05", "2025-01-06", "2025-01-07"]
+    assert rejected["reject_reason"].tolist() == ["date"]
+
+
+def test_streaming_csv_import_quarantines_bad_rows(temp_db, tmp_path):
+    pytest.importorskip("pandas")
+    from scripts.csv_import import import_fitness_csv
+
+    src = tmp_path / "fitness.csv"
+    lines = ["user_id,date,steps,heart_rate"]
+    lines += [f"1,2025-01-{day:02d},{day * 100},70" for day in range(1, 29)]
+    lines += ["1,2025-01-05,999,70", "2,not-a-date,10,70", "2,2025-01-01,abc,70"]
+    src.write_text("\n".join(lines) + "\n")
+    reject_path = tmp_path / "rejects.csv"
+    seen = []
+
+    result = import_fitness_csv(str(src), reject_path=str(reject_path), chunk_rows=10,
+                                on_progress=lambda fraction, counts: seen.append(fraction))
+
+    assert (result["rows"], result["inserted"], result["duplicates"], result["rejected"]) == (31, 28, 1, 2)
+    assert seen[-1] == 1.0 and len(seen) == 5
+    assert reject_path.read_text().count("\n") == 3  # header + 2 rejected rows
+    assert temp_db.fetch_fitness(1)["steps"] == 2800
+
+
+def test_fetch_fitness_range_filters_and_resamples(temp_db):
+    pytest.importorskip("pandas")
+    rows = [(1, 22.0, 1000 * d, 7.0, 1800, 60 + d, 1.0, 120, f"2025-01-{d:02d}") for d in range(1, 15)]
+    rows.append((2, 22.0, 50, 7.0, 1800, 70, 1.0, 120, "2025-01-03"))
+    temp_db.add_fitness_data_many(rows)
+
+    df = temp_db.fetch_fitness_range(1, "2025-01-06", "2025-01-12", columns=["steps", "heart_rate"])
+    assert list(df.columns) == ["date", "steps", "heart_rate"]
+    assert df["steps"].tolist() == [6000, 7000, 8000, 9000, 10000, 11000, 12000]
+
+    weekly = temp_db.fetch_fitness_range(1, columns=["steps"], resample="week")
+    # 2025-01-06 is a Monday: Jan 1-5 fall into the week starting Dec 30
+    assert weekly["date"].dt.strftime("%Y-%m-%d").tolist() == ["2024-12-30", "2025-01-06", "2025-01-13"]
+    assert weekly["steps"].tolist() == [3000.0, 9000.0, 13500.0]
+
+    with pytest.raises(ValueError):
+        temp_db.fetch_fitness_range(1, columns=["steps; DROP TABLE users"])
+
+
+def test_fetch_patients_overview_returns_latest_vitals_per_patient(temp_db):
+    doc = temp_db.add_user("Doc", "doc@example.com", "1", "hash", "doctor")
+    a = temp_db.add_user("Alice", "alice@example.com", "1", "hash", "patient", doctor_id=doc)
+    b = temp_db.add_user("Bob", "bob@example.com", "1", "hash", "patient", doctor_id=doc)
+    temp_db.add_user("Other", "other@example.com", "1", "hash", "patient", doctor_id=doc + 100)
+    temp_db.add_fitness_data(a, 22.0, 1000, 7.0, 1800, 70, 1.0, 120, "2025-01-01")
+    temp_db.add_fitness_data(a, 22.0, 5000, 7.0, 1800, 75, 1.0, 125, "2025-01-02")
+    temp_db.add_medication(a, "Aspirin", "Morning", created_by=doc)
+    temp_db.add_medication(a, "Metformin", "Night", created_by=doc)
+
+    overview = temp_db.fetch_patients_overview(doc)
+    assert [p["name"] for p in overview] == ["Alice", "Bob"]
+    alice, bob = overview
+    assert alice["fitness"]["steps"] == 5000 and alice["fitness"]["bp"] == 125
+    assert alice["medication_count"] == 2 and alice["last_updated"]
+    assert bob["fitness"] == temp_db.fetch_fitness(b) and bob["medication_count"] == 0
+
+
+def test_cohort_analytics_groups_panel_and_flags_outliers(temp_db):
+    from agents.cohort_analytics import cohort_analytics
+
+    doc = temp_db.add_user("Doc", "doc@example.com", "1", "hash", "doctor")
+    ids = [temp_db.add_user(f"P{i}", f"p{i}@example.com", "1", "hash", "patient", doctor_id=doc)
+           for i in range(6)]
+    temp_db.add_user("Nodata", "nodata@example.com", "1", "hash", "patient", doctor_id=doc)
+    rows = []
+    for i, uid in enumerate(ids):
+        steps = 500 if i == 0 else 6000 + 100 * i   # P0 is far below the panel
+        hr = 130 if i == 1 else 70
+        rows += [(uid, 22.0, steps, 7.0, 2000, hr, 1.0, 120, d) for d in ("2025-01-01", "2025-01-02")]
+    temp_db.add_fitness_data_many(rows)
+
+    cohort = cohort_analytics(doc, window_days=None)
+    patients = cohort["patients"].set_index("name")
+    assert len(patients) == 7 and patients.loc["P2", "days"] == 2
+    assert patients.loc["P3", "steps_mean"] == 6300
+    assert cohort["risk_counts"] == {"High": 2, "Medium": 0, "Low": 4, "No data": 1}
+    assert list(cohort["patients"]["name"][:2]) == ["P0", "P1"]
+    assert patients.loc["P0", "outliers"] == "steps low"
+    assert patients.loc["P1", "outliers"] == "heart_rate high"
+    assert cohort["distribution"].loc["steps", "count"] == 6
+    assert set(cohort["outliers"]["name"]) == {"P0", "P1"}
+
+
+def test_purge_users_cascades_and_reports_counts(temp_db):
+    doc = temp_db.add_user("Doc", "doc@example.com", "1", "hash", "doctor")
+    ids = [temp_db.add_user(f"P{i}", f"p{i}@example.com", "1", "hash", "patient", doctor_id=doc) for i in range(5)]
+    keep = temp_db.add_user("Keep", "keep@example.com", "1", "hash", "patient", doctor_id=doc)
+    for uid in ids + [keep]:
+        temp_db.add_medication(uid, "Aspirin", "Morning")
+        temp_db.add_fitness_data(uid, 22.0, 1000, 7.0, 1800, 70, 1.0, 120, "2025-01-01")
+
+    counts = temp_db.purge_users(ids + [doc], chunk_size=2)
+    assert counts["users"] == 6
+    assert (counts["medications"], counts["fitness_data"], counts["goals"]) == (5, 5, 0)
+    assert temp_db.get_user_by_id(keep)["doctor_id"] is None
+    assert temp_db.fetch_medications(keep) and temp_db.fetch_fitness(keep)["steps"] == 1000
+
+
+def test_every_per_user_table_is_in_the_deletion_cascade(temp_db):
+    conn = temp_db.get_connection()
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    per_user = {t for t in tables if "user_id" in {c[1] for c in conn.execute(f"PRAGMA table_info({t})")}}
+    assert per_user <= {table for table, _ in temp_db.USER_OWNED_TABLES}
+
+
+def test_delete_user_rolls_back_on_failure(temp_db):
+    uid = temp_db.add_user("Pat", "pat@example.com", "1", "hash", "patient")
+    temp_db.add_medication(uid, "Aspirin", "Morning")
+    temp_db.get_connection().execute(
+        "CREATE TRIGGER no_delete BEFORE DELETE ON users BEGIN SELECT RAISE(ABORT, 'locked'); END")
+    with pytest.raises(Exception):
+        temp_db.delete_user_and_related(uid)
+    assert temp_db.fetch_medications(uid)
+
+
+def test_user_cache_serves_reads_and_is_invalidated_by_writes(temp_db):
+    doc = temp_db.add_user("Doc", "doc@example.com", "1", "hash", "doctor")
+    pat = temp_db.add_user("Pat", "pat@example.com", "1", "hash", "patient", doctor_id=doc)
+    assert [p["id"] for p in temp_db.fetch_patients_of_doctor(doc)] == [pat]
+
+    calls = []
+    temp_db.get_connection().set_trace_callback(calls.append)
+    assert temp_db.get_user_by_id(pat)["doctor_id"] == doc
+    assert temp_db.get_user_by_id(pat)["doctor_id"] == doc
+    temp_db.fetch_patients_of_doctor(doc)
+    assert len([c for c in calls if c.startswith("SELECT")]) == 1
+    temp_db.get_connection().set_trace_callback(None)
+
+    new_pat = temp_db.add_user("New", "new@example.com", "1", "hash", "patient", doctor_id=doc)
+    assert {p["id"] for p in temp_db.fetch_patients_of_doctor(doc)} == {pat, new_pat}
+
+    temp_db.delete_user_and_related(doc)
+    assert temp_db.get_user_by_id(doc) is None
+    assert temp_db.get_user_by_id(pat)["doctor_id"] is temp_db.get_user_by_id(new_pat)["doctor_id"] is None
+
+
+def test_rollups_follow_inserts_updates_and_rebuild(temp_db):
+    pytest.importorskip("pandas")
+    from scripts.rollups import rebuild_rollups
+
+    rows = [(1, 22.0, 1000 * d, 7.0, 1800, 60 + d, 1.0, 120, f"2025-01-{d:02d}") for d in range(6, 13)]
+    temp_db.bulk_import_fitness([dict(zip(temp_db.FITNESS_COLUMNS, r)) for r in rows])
+    temp_db.update_latest_fitness(1, 22.0, 500, 7.0, 1800, 90, 1.0, 120, "2025-01-12")
+    temp_db.add_fitness_data(1, 22.0, 4000, 7.0, 1800, 70, 1.0, 120, "2025-01-13")
+
+    weekly = temp_db.fetch_fitness_rollup(1, "week", metrics=["steps", "heart_rate"])
+    assert weekly["date"].dt.strftime("%Y-%m-%d").tolist() == ["2025-01-06", "2025-01-13"]
+    first = weekly.iloc[0]
+    assert (first["n"], first["steps_sum"], first["steps_min"], first["steps_max"]) == (7, 51500, 500, 11000)
+    assert first["heart_rate_max"] == 90
+
+    daily = temp_db.fetch_fitness_rollup(1, "day", start="2025-01-12", end="2025-01-12")
+    assert daily["steps_mean"].tolist() == [500.0]
+
+    conn = temp_db.get_connection()
+    before = conn.execute("SELECT * FROM fitness_weekly_rollup ORDER BY week_start").fetchall()
+    rebuild_rollups(conn)
+    assert conn.execute("SELECT * FROM fitness_weekly_rollup ORDER BY week_start").fetchall() == before
+
+    temp_db.delete_user_and_related(1)
+    assert conn.execute("SELECT COUNT(*) FROM fitness_daily_rollup").fetchone()[0] == 0
+
+
+def test_online_stats_track_inserts_corrections_and_duplicates(temp_db):
+    import numpy as np
+    import pandas as pd
+    from scripts.online_stats import EWMA_SPAN_DAYS, rebuild_online_stats
+
+    days = [f"2025-03-{d:02d}" for d in range(1, 21)]
+    hr = [60 + (d * 7) % 23 for d in range(20)]
+    temp_db.add_fitness_data_many([(1, 22.0, 5000, 7.0, 2000, h, 1.0, 120, d) for h, d in zip(hr, days)])
+    temp_db.add_fitness_data_many([(1, 22.0, 5000, 7.0, 2000, 999, 1.0, 120, days[3])])  # skipped duplicate
+    temp_db.update_latest_fitness(1, 22.0, 5000, 7.0, 2000, 95, 1.0, 120, days[5])      # correct an old day
+    hr[5] = 95
+    temp_db.update_latest_fitness(1, 22.0, 5000, 7.0, 2000, 180, 1.0, 120, days[-1])   # re-save the latest
+    hr[-1] = 180
+
+    stats = temp_db.fetch_online_stats(1)["heart_rate"]
+    assert stats["n"] == 20 and stats["last"] == 180 and stats["last_date"] == days[-1]
+    assert np.isclose(stats["mean"], np.mean(hr)) and np.isclose(stats["std"], np.std(hr, ddof=1))
+    # The correction of day 5 is not replayed into the EWMA (it only follows the newest day).
+    ewm_hr = list(hr)
+    ewm_hr[5] = 60 + (5 * 7) % 23
+    ewm = pd.Series(ewm_hr, dtype=float).ewm(span=EWMA_SPAN_DAYS, adjust=False)
+    assert np.isclose(stats["ewma"], ewm.mean().iloc[-1])
+    assert np.isclose(stats["ewm_std"], np.sqrt(ewm.var(bias=True).iloc[-1]))
+    assert stats["z"] == (180 - stats["ewma"]) / stats["ewm_std"]
+
+    conn = temp_db.get_connection()
+    rebuild_online_stats(conn)
+    rebuilt = temp_db.fetch_online_stats(1)["heart_rate"]
+    assert np.isclose(rebuilt["std"], stats["std"]) and rebuilt["n"] == 20
+
+    temp_db.purge_users([1])
+    assert temp_db.fetch_online_stats(1) == {}
+
+
+def test_predict_risk_flags_values_unusual_for_the_patient():
+    from agents.risk_ml import predict_risk
+
+    def baseline(last):
+        return {"heart_rate": {"prev_ewma": 62.0, "prev_ewm_std": 3.0, "last": last, "last_date": "2025-01-02"}}
+
+    day = {"steps": 8000, "date": "2025-01-02"}
+    assert predict_risk(dict(day, heart_rate=64), baseline=baseline(64))["level"] == "Low"
+    risk = predict_risk(dict(day, heart_rate=90), baseline=baseline(90))
+    assert risk["level"] == "Medium" and risk["unusual"] == {"heart_rate": 9.33}
+    assert "unusual" not in predict_risk(dict(day, heart_rate=90))
+    # the baseline's latest reading is from another day: nothing to compare
+    assert predict_risk(dict(day, heart_rate=90, date="2025-01-03"), baseline=baseline(90))["unusual"] == {}
+
+
+def test_missing_vital_does_not_raise_risk(temp_db):
+    from agents.langgraph_workflow import HealthWorkflow
+
+    rows = [(1, 22.0, 8000, 7.0, 1800, 60 + d % 3, 1.0, 120, f"2025-01-{d:02d}") for d in range(1, 21)]
+    temp_db.add_fitness_data_many(rows)
+    temp_db.add_fitness_data(1, 22.0, 8000, 7.0, 1800, None, 1.0, 120, "2025-01-21")
+    workflow = HealthWorkflow(1)
+    risk = workflow.compute_risk(temp_db.fetch_fitness(1))
+    assert risk["level"] == "Low" and risk["unusual"] == {}
+
+    # a real outlier is scored against the baseline before its own day
+    temp_db.add_fitness_data(1, 22.0, 8000, 7.0, 1800, 95, 1.0, 120, "2025-01-22")
+    risk = workflow.compute_risk(temp_db.fetch_fitness(1))
+    stats = temp_db.fetch_online_stats(1)["heart_rate"]
+    assert risk["level"] == "Medium"
+    assert risk["unusual"]["heart_rate"] == round((95 - stats["prev_ewma"]) / stats["prev_ewm_std"], 2)
+
+
+def test_analytics_cache_is_per_user_and_invalidated_by_writes(temp_db, monkeypatch):
+    from agents import analytics_agent
+
+    analytics_agent.clear_analytics_cache()
+    calls = []
+    real = analytics_agent.fetch_fitness_history
+    monkeypatch.setattr(analytics_agent, "fetch_fitness_history",
+                        lambda user_id, **kw: calls.append(user_id) or real(user_id, **kw))
+    temp_db.add_fitness_data(1, 22.0, 4000, 7.0, 2000, 70, 1.0, 120, "2025-01-01")
+    temp_db.add_fitness_data(2, 22.0, 9000, 7.0, 2000, 70, 1.0, 120, "2025-01-01")
+
+    assert analytics_agent.get_analytics(1)["average_steps"] == 4000
+    assert analytics_agent.get_analytics(2)["average_steps"] == 9000
+    analytics_agent.get_analytics(1)["metrics"].clear()          # callers get copies
+    assert analytics_agent.get_analytics(1)["average_steps"] == 4000
+    assert calls == [1, 2]
+
+    version = temp_db.get_fitness_version(1)
+    temp_db.update_latest_fitness(1, 22.0, 6000, 7.0, 2000, 70, 1.0, 120, "2025-01-01")
+    assert temp_db.get_fitness_version(1) == version + 1
+    assert analytics_agent.get_analytics(1)["average_steps"] == 6000
+    assert analytics_agent.get_analytics(2)["average_steps"] == 9000
+    assert calls == [1, 2, 1]
+
+
+def test_anomalies_are_scored_on_ingest_and_replaced_on_correction(temp_db):
+    from scripts.anomalies import rescore_all
+
+    days = [f"2025-04-{d:02d}" for d in range(1, 21)]
+    rows = [(1, 22.0, 6000 + 100 * (i % 5), 7.0, 2000, 68 + i % 3, 1.0, 120, d) for i, d in enumerate(days)]
+    rows[15] = (1, 22.0, 6200, 7.0, 2000, 140, 1.0, 120, days[15])      # heart-rate spike
+    temp_db.add_fitness_data_many(rows)
+
+    events = temp_db.fetch_anomalies(1)
+    assert [(e["date"], e["metric"]) for e in events] == [(days[15], "heart_rate")]
+    assert events[0]["baseline"] == 69 and events[0]["z"] > 3.5
+
+    temp_db.update_latest_fitness(1, 22.0, 6200, 7.0, 2000, 69, 1.0, 120, days[15])  # corrected reading
+    temp_db.update_latest_fitness(1, 22.0, 50, 7.0, 2000, 69, 1.0, 120, days[-1])    # new spike in steps
+    assert [(e["date"], e["metric"]) for e in temp_db.fetch_anomalies(1)] == [(days[-1], "steps")]
+
+    conn = temp_db.get_connection()
+    assert rescore_all(conn) == 1
+    temp_db.purge_users([1])
+    assert temp_db.fetch_anomalies(1) == []
+
+
+def test_back_filled_days_rescore_the_days_after_them(temp_db):
+    days = [f"2025-05-{d:02d}" for d in range(1, 9)]
+    flat = [(1, 22.0, 6000, 7.0, 2000, 70, 1.0, 120, d) for d in days[:6]]
+    temp_db.add_fitness_data_many(flat + [(1, 22.0, 6000, 7.0, 2000, 100, 1.0, 120, days[7])])
+    assert temp_db.fetch_anomalies(1) == []          # only 6 prior days: not scored yet
+
+    temp_db.update_latest_fitness(1, 22.0, 6000, 7.0, 2000, 70, 1.0, 120, days[6])
+    assert [(e["date"], e["metric"]) for e in temp_db.fetch_anomalies(1)] == [(days[7], "heart_rate")]
+    temp_db.update_latest_fitness(1, 22.0, 6000, 7.0, 2000, None, 1.0, 120, days[0])  # reading withdrawn
+    assert temp_db.fetch_anomalies(1) == []
+
+
+def test_anomaly_detection_is_set_based_on_bulk_ingest(temp_db, monkeypatch):
+    from scripts import anomalies
+
+    calls = []
+
+    class CountingConnection:
+        """Counts the statements detect_anomalies sends, whatever their row count."""
+        def __init__(self, conn):
+            self._conn = conn
+
+        def execute(self, *args):
+            calls[-1] += 1
+            return self._conn.execute(*args)
+
+        def executemany(self, *args):
+            calls[-1] += 1
+            return self._conn.executemany(*args)
+
+    def counted(conn, keys):
+        calls.append(0)
+        return anomalies.detect_anomalies(CountingConnection(conn), keys)
+
+    monkeypatch.setattr(db_operations, "detect_anomalies", counted)
+
+    def ingest(first_user, users, days):
+        temp_db.add_fitness_data_many(
+            [(u, 22.0, 5000 + (u * 7 + d) % 11 * 50, 7.0, 2000, 68 + (u + d) % 5, 1.0, 120,
+              f"2024-{1 + d // 28:02d}-{1 + d % 28:02d}")
+             for u in range(first_user, first_user + users) for d in range(days)])
+
+    ingest(1, 2, 30)
+    ingest(100, 20, 200)           # 4,000 rows: still one batch of statements
+    temp_db.add_fitness_data(1, 22.0, 9000, 7.0, 2000, 70, 1.0, 120, "2024-01-10")  # back-fill
+    assert calls[0] == calls[1] == calls[2] and calls[0] <= 10, calls
+
+
+def test_archive_moves_old_rows_and_history_reads_both_stores(temp_db, tmp_path):
+    pytest.importorskip("pyarrow")
+    rows = [(1, 22.0, 100 * d, 7.0, 1800, 70, 1.0, 120, f"2024-{m:02d}-{d:02d}")
+            for m in (1, 2, 3) for d in (1, 15)]
+    temp_db.add_fitness_data_many(rows)
+    archive_dir = str(tmp_path / "cold")
+
+    result = archive.archive_fitness_data(before="2024-03-01", archive_dir=archive_dir)
+    assert result["archived"] == 4
+    assert sorted(os.listdir(os.path.join(archive_dir, "user_id=1"))) == ["month=2024-01", "month=2024-02"]
+    assert len(temp_db.fetch_fitness_range(1)) == 2
+
+    history = archive.fetch_fitness_history(1, "2024-01-10", "2024-03-10", columns=["steps"],
+                                            archive_dir=archive_dir)
+    assert history["date"].dt.strftime("%Y-%m-%d").tolist() == ["2024-01-15", "2024-02-01", "2024-02-15",
+                                                                "2024-03-01"]
+    assert history["steps"].tolist() == [1500, 100, 1500, 100]
+
+    archive.delete_user_archives([1], archive_dir=archive_dir)
+    assert not os.path.exists(os.path.join(archive_dir, "user_id=1"))
+
+
+def test_rearchived_days_keep_the_latest_copy_and_rebuilds_keep_archived_days(temp_db, tmp_path):
+    pytest.importorskip("pyarrow")
+    from scripts.anomalies import rescore_all
+    from scripts.online_stats import rebuild_online_stats
+    from scripts.rollups import rebuild_rollups
+
+    rows = [(1, 22.0, 5000, 7.0, 1800, 70, 1.0, 120, f"2024-01-{d:02d}") for d in range(1, 11)]
+    temp_db.add_fitness_data_many(rows + [(1, 22.0, 6000, 7.0, 1800, 70, 1.0, 120, "2024-03-01")])
+    archive_dir = str(tmp_path / "cold")
+    archive.archive_fitness_data(before="2024-02-01", archive_dir=archive_dir)
+    # A late correction of an archived day, archived again
+    temp_db.add_fitness_data(1, 22.0, 7777, 7.0, 1800, 70, 1.0, 120, "2024-01-05")
+    archive.archive_fitness_data(before="2024-02-01", archive_dir=archive_dir)
+
+    history = archive.fetch_fitness_history(1, columns=["steps"], archive_dir=archive_dir)
+    assert len(history) == 11 and history.loc[history["date"] == "2024-01-05", "steps"].tolist() == [7777]
+
+    conn = temp_db.get_connection()
+    days_before = conn.execute("SELECT COUNT(*) FROM fitness_daily_rollup").fetchone()[0]
+    rebuild_rollups(conn)
+    rescore_all(conn)
+    rebuild_online_stats(conn, archive_dir=archive_dir)
+    assert conn.execute("SELECT COUNT(*) FROM fitness_daily_rollup").fetchone()[0] == days_before == 11
+    assert temp_db.fetch_fitness_rollup(1, "week", "2024-01-01", "2024-01-07")["n"].tolist() == [7]
+    stats = temp_db.fetch_online_stats(1, metrics=["steps"])["steps"]
+    assert stats["n"] == 11 and stats["mean"] == pytest.approx((9 * 5000 + 7777 + 6000) / 11)
+
+
+def test_risk_feature_store_follows_the_latest_record(temp_db):
+    from scripts.feature_store import FEATURE_TABLE, rebuild_risk_features
+
+    temp_db.add_fitness_data_many([
+        (1, 22.0, 4000, 7.0, 1800, 70, 2.0, 120, "2025-01-02"),
+        (1, 23.0, 5000, 6.5, 1900, 72, 3.0, 125, "2025-01-01"),   # back-filled, but the newest record
+        (2, None, 8000, 8.0, 2100, 60, 4.0, 110, "2025-01-01"),
+    ])
+    assert temp_db.fetch_risk_feature_vector(1) == (23.0, 5000, 1900, 6.5, 72, 125, 3.0)
+    assert temp_db.fetch_risk_feature_vector(2) == (0, 8000, 2100, 8.0, 60, 110, 4.0)
+    assert temp_db.fetch_risk_feature_vector(3) is None
+
+    temp_db.update_latest_fitness(1, 23.0, 9000, 6.5, 1900, 72, 3.0, 125, "2025-01-01")
+    features = temp_db.fetch_risk_features([2, 1, 5]).set_index("user_id")
+    assert list(features.columns[:2]) == ["BMI", "Daily_Steps"] and sorted(features.index) == [1, 2]
+    assert features.loc[1, "Daily_Steps"] == 9000 and features.loc[1, "date"] == "2025-01-01"
+
+    conn = temp_db.get_connection()
+    conn.execute(f"DELETE FROM {FEATURE_TABLE} WHERE user_id = 2")
+    before = temp_db.fetch_risk_features().sort_values("user_id").reset_index(drop=True)
+    rebuild_risk_features(conn)
+    after = temp_db.fetch_risk_features().sort_values("user_id").reset_index(drop=True)
+    assert len(before) == 1 and after.iloc[:1].equals(before) and after["user_id"].tolist() == [1, 2]
+
+    temp_db.purge_users([1])
+    assert temp_db.fetch_risk_feature_vector(1) is None
+
+
+def test_legacy_database_merges_users_medications_and_vitals(temp_db, tmp_path):
+    import sqlite3
+    from scripts.merge_legacy_db import merge_legacy_db
+
+    source = str(tmp_path / "health_data.db")
+    legacy = sqlite3.connect(source)
+    legacy.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, password_hash TEXT, role TEXT,
+                            doctor_id INTEGER, patient_id INTEGER);
+        CREATE TABLE medications (id INTEGER PRIMARY KEY, user_id INTEGER, med_name TEXT, schedule TEXT);
+        CREATE TABLE fitness_data (id INTEGER PRIMARY KEY, user_id INTEGER, date TEXT, steps INTEGER,
+                                   heart_rate INTEGER, sleep_hours REAL, calories_burned INTEGER,
+                                   systolic_bp INTEGER, diastolic_bp INTEGER, temperature REAL);
+        INSERT INTO users VALUES (1, 'Doc', 'doc@example.com', 'h', 'doctor', NULL, NULL),
+                                 (2, 'Pat', 'pat@example.com', 'h', 'patient', 1, NULL);
+        INSERT INTO medications VALUES (1, 2, 'Paracetamol', 'Night'), (2, 2, 'Paracetamol', 'Night'),
+                                       (3, 2, 'Vitamin D3', 'Morning');
+        INSERT INTO fitness_data VALUES (1, 2, '2025-12-07', 5000, 75, 7.5, 220, 120, 80, 98.6);
+    """)
+    legacy.commit()
+    legacy.close()
+    doc_id = temp_db.add_user("Doc", "doc@example.com", "1", "hash", "doctor")
+
+    assert merge_legacy_db(source) == {"users": 1, "existing_users": 1, "medications": 2, "fitness_data": 1}
+    pat = temp_db.get_user_by_email("pat@example.com")
+    assert pat["doctor_id"] == doc_id
+    assert sorted(m[0] for m in temp_db.fetch_medications(pat["id"])) == ["Paracetamol", "Vitamin D3"]
+    assert (temp_db.fetch_fitness(pat["id"])["steps"], temp_db.fetch_fitness(pat["id"])["bp"]) == (5000, 120)
+
+    assert merge_legacy_db(source) == {"users": 0, "existing_users": 2, "medications": 0, "fitness_data": 0}
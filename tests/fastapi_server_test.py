@@ -0,0 +1,35 @@
+import sys, os, asyncio, importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from scripts import db_operations
+    monkeypatch.setattr(db_operations, "DB_NAME", str(tmp_path / "api.db"))
+    import backend.fastapi_server as server
+    server = importlib.reload(server)
+    with TestClient(server.app) as c:
+        yield c
+
+
+def test_register_login_and_seed_are_async(client):
+    import backend.fastapi_server as server
+    assert asyncio.iscoroutinefunction(server.login)
+
+    r = client.post("/register", json={"name": "Pat", "email": "Pat@Example.com", "password": "pw", "role": "patient"})
+    assert r.status_code == 200 and r.json()["email"] == "pat@example.com"
+    assert client.post("/register", json={"name": "Pat", "email": "pat@example.com", "password": "pw",
+                                          "role": "patient"}).status_code == 400
+
+    r = client.post("/login", json={"email": "pat@example.com", "password": "pw"})
+    assert r.status_code == 200 and r.json()["role"] == "patient"
+    assert client.post("/login", json={"email": "pat@example.com", "password": "bad"}).status_code == 401
+
+    assert client.post("/seed-demo-users").json()["added"] == 3
+    assert client.post("/seed-demo-users").json()["added"] == 0
@@ -0,0 +1,267 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import importlib
+import threading
+
+import pytest
+from models import registry
+
+
+@pytest.fixture
+def fresh_registry(monkeypatch):
+    """Registry with nothing loaded yet."""
+    monkeypatch.setattr(registry, "_bundle", None)
+    monkeypatch.setattr(registry, "_compiled", None)
+    monkeypatch.setattr(registry, "_load_count", 0)
+    # an empty cache, seen by every module that imported it by name
+    import models.predict
+    cache = registry.TTLCache(maxsize=registry.PREDICTION_CACHE_SIZE)
+    for module in (registry, models.predict):
+        monkeypatch.setattr(module, "prediction_cache", cache)
+    yield registry
+
+
+def test_importing_predict_does_not_load_or_print(fresh_registry, capsys):
+    import models.predict
+    importlib.reload(models.predict)
+    assert capsys.readouterr().out == ""
+    metrics = fresh_registry.model_metrics()
+    assert metrics["loaded"] is False and metrics["load_count"] == 0
+
+
+def test_model_loads_once_from_any_working_directory(fresh_registry, tmp_path, monkeypatch):
+    from models.predict import predict_risk
+
+    monkeypatch.chdir(tmp_path)
+    bundles = []
+    threads = [threading.Thread(target=lambda: bundles.append(fresh_registry.get_risk_model())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(b is bundles[0] for b in bundles)
+    assert predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7) in ("Low", "Medium", "High")
+
+    metrics = fresh_registry.model_metrics()
+    assert metrics["loaded"] and metrics["load_count"] == 1
+    assert metrics["n_estimators"] > 0 and metrics["model_bytes"] > 0 and metrics["load_seconds"] >= 0
+    assert fresh_registry.reload_risk_model() is not bundles[0]
+    assert fresh_registry.model_metrics()["load_count"] == 2
+
+
+def test_memory_mapped_load_matches(fresh_registry):
+    import numpy as np
+
+    plain = fresh_registry.load_risk_model()
+    mapped = fresh_registry.load_risk_model(mmap_mode="r")
+    x = plain.scaler.transform(np.array([[26.55, 12486, 2837, 7.4, 71, 102, 0.7]]))
+    assert mapped.metrics["mmap_mode"] == "r" and mapped.version == plain.version
+    assert (mapped.model.predict_proba(x) == plain.model.predict_proba(x)).all()
+
+
+def test_predict_risk_batch_matches_single_predictions():
+    import pandas as pd
+    from models.predict import FEATURES, predict_risk, predict_risk_batch
+
+    data = pd.read_csv(os.path.join(registry.MODELS_DIR, "health_data.csv")).head(25)
+    batch = predict_risk_batch(data, n_jobs=2)
+    assert list(batch.index) == list(data.index)
+    assert {c for c in batch.columns if c.startswith("p_")} == {"p_High", "p_Low", "p_Medium"}
+    assert (batch.filter(like="p_").sum(axis=1).round(6) == 1).all()
+    singles = [predict_risk(*row) for row in data[list(FEATURES)].itertuples(index=False)]
+    assert list(batch["risk_level"]) == singles
+    assert list(predict_risk_batch(data[list(FEATURES)].to_numpy())["risk_level"]) == singles
+
+    with pytest.raises(ValueError):
+        predict_risk_batch([[1, 2, 3]])
+
+
+def test_predict_risk_batch_reads_latest_records_for_user_ids(tmp_path, monkeypatch):
+    from scripts import db_operations
+    from models.predict import predict_risk, predict_risk_batch
+
+    monkeypatch.setattr(db_operations, "DB_NAME", str(tmp_path / "test.db"))
+    db_operations.create_tables()
+    try:
+        db_operations.add_fitness_data(1, 31.0, 900, 4.5, 3400, 118, 0.5, 138, "2025-01-01")
+        db_operations.add_fitness_data(1, 22.0, 12000, 8.0, 2100, 65, 6.0, 110, "2025-01-02")
+        db_operations.add_fitness_data(2, 33.0, 1500, 5.0, 3300, 115, 1.0, 135, "2025-01-02")
+        batch = predict_risk_batch(user_ids=[2, 1, 3])
+    finally:
+        db_operations.close_connection()
+    assert sorted(batch.index) == [1, 2]
+    assert batch.loc[1, "risk_level"] == predict_risk(22.0, 12000, 2100, 8.0, 65, 110, 6.0)
+    assert batch.loc[2, "risk_level"] == predict_risk(33.0, 1500, 3300, 5.0, 115, 135, 1.0)
+
+
+def test_compiled_forest_matches_sklearn(fresh_registry, tmp_path, monkeypatch):
+    import shutil
+    import numpy as np
+    import pandas as pd
+    from models.compiled_forest import COMPILED_FILE, CompiledForest, export_bundle
+    from models.predict import FEATURES
+
+    for name in fresh_registry.ARTIFACTS.values():
+        shutil.copy(os.path.join(fresh_registry.MODELS_DIR, name), tmp_path)
+    monkeypatch.setattr(fresh_registry, "MODEL_DIR", str(tmp_path))
+
+    bundle = fresh_registry.get_risk_model()
+    data = pd.read_csv(os.path.join(fresh_registry.MODELS_DIR, "health_data.csv"))[list(FEATURES)]
+    rng = np.random.default_rng(0)
+    X = np.vstack([data.to_numpy(dtype=float), data.sample(200, random_state=0).to_numpy() * rng.uniform(0.7, 1.3, (200, 7))])
+
+    compiled = fresh_registry.get_compiled_model()
+    expected = bundle.model.predict_proba(bundle.scaler.transform(pd.DataFrame(X, columns=list(FEATURES))))
+    assert np.allclose(compiled.predict_proba(X), expected, atol=1e-12)
+    assert (compiled.predict(X) == bundle.encoder.inverse_transform(expected.argmax(axis=1))).all()
+
+    # Cached next to the pickle, reused by version, dropped on reload
+    reloaded = CompiledForest.load(str(tmp_path / COMPILED_FILE))
+    assert reloaded.version == bundle.version and np.array_equal(reloaded.value, compiled.value)
+    assert fresh_registry.get_compiled_model() is compiled
+    fresh_registry.reload_risk_model()
+    assert fresh_registry.get_compiled_model() is not compiled
+    assert export_bundle(bundle).nbytes == compiled.nbytes
+
+
+def test_prediction_cache_counts_and_clears_on_reload(fresh_registry):
+    import models.predict
+
+    cache = fresh_registry.prediction_cache
+
+    first = models.predict.predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7)
+    assert models.predict.predict_risk(26.55, 12486.0, 2837, 7.4, 71, 102, 0.7) == first
+    models.predict.predict_risk(26.551, 12486, 2837, 7.4, 71, 102, 0.7)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2 and len(cache) == 2
+    assert fresh_registry.model_metrics()["prediction_cache"]["hits"] == 1
+
+    fresh_registry.reload_risk_model()
+    assert len(cache) == 0
+    assert models.predict.predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7) == first
+
+
+def test_cached_predictions_match_the_model_on_the_raw_input(fresh_registry):
+    import numpy as np
+    import models.predict
+
+    rng = np.random.default_rng(0)
+    base = np.array([26.55, 12486, 2837, 7.4, 71, 102, 0.7])
+    rows = base * rng.uniform(0.5, 1.5, size=(2000, len(base)))
+    expected = fresh_registry.get_compiled_model().predict(rows)
+    for _ in range(2):  # second pass answered from the cache
+        assert [models.predict.predict_risk(*row) for row in rows] == [str(e) for e in expected]
+
+
+def test_prediction_cache_is_bounded(fresh_registry, monkeypatch):
+    import models.predict
+
+    cache = fresh_registry.TTLCache(maxsize=3)
+    monkeypatch.setattr(models.predict, "prediction_cache", cache)
+    for steps in range(5000, 5005):
+        models.predict.predict_risk(26.55, steps, 2837, 7.4, 71, 102, 0.7)
+    assert len(cache) == 3 and cache.stats()["evictions"] == 2
+
+
+def test_risk_engine_scores_with_the_first_working_backend(fresh_registry, tmp_path, monkeypatch):
+    import pandas as pd
+    from agents.risk_engine import RiskEngine
+    from models.predict import predict_risk
+
+    fitness = {"bmi": 26.55, "steps": 12486, "calories": 2837, "sleep": 7.4, "heart_rate": 71,
+               "bp": 102, "exercise": 0.7, "date": "2024-01-01"}
+    engine = RiskEngine(["forest", "rules"])
+    risk = engine.predict(fitness)
+    assert risk["backend"] == "forest" and risk["level"] == predict_risk(26.55, 12486, 2837, 7.4, 71, 102, 0.7)
+
+    frame = pd.DataFrame([fitness, dict(fitness, steps=None, heart_rate=130)], index=[7, 9])
+    batch = engine.predict_batch(frame)
+    assert list(batch.index) == [7, 9] and batch.loc[7, "risk_level"] == risk["level"]
+    assert RiskEngine(["rules"]).predict_batch(frame)["risk_level"].tolist() == ["Low", "High"]
+
+    # no model files: the forest is skipped, the rules answer
+    monkeypatch.setattr(fresh_registry, "MODEL_DIR", str(tmp_path))
+    risk = engine.predict(dict(fitness, heart_rate=130), baseline={})
+    assert risk["backend"] == "rules" and risk["level"] == "High" and risk["unusual"] == {}
+    stats = engine.stats()
+    assert stats["forest"]["calls"] == 2 and stats["forest"]["rows"] == 3 and stats["forest"]["mean_ms"] > 0
+    assert stats["rules"]["calls"] == 1 and stats["rules"]["errors"] == 0
+
+
+def test_risk_engine_falls_back_when_a_backend_fails(monkeypatch):
+    from agents import risk_engine
+
+    def broken(self, features):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(risk_engine.ForestBackend, "available", lambda self: True)
+    monkeypatch.setattr(risk_engine.ForestBackend, "predict", broken)
+    engine = risk_engine.RiskEngine(["forest", "rules"])
+    assert engine.predict({"steps": 500})["backend"] == "rules"
+    assert engine.stats()["forest"]["errors"] == 1
+    with pytest.raises(RuntimeError):
+        risk_engine.RiskEngine(["forest"]).predict({"steps": 500})
+    with pytest.raises(ValueError):
+        risk_engine.RiskEngine(["svm"])
+
+
+def test_training_pipeline_searches_then_warm_starts(fresh_registry, tmp_path, monkeypatch):
+    import json
+    import numpy as np
+    import pandas as pd
+    from models import train
+    from scripts import db_operations
+
+    monkeypatch.setattr(db_operations, "DB_NAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(train, "MIN_NEW_ROWS", 50)
+    db_operations.create_tables()
+    rng = np.random.default_rng(0)
+
+    def add_days(first_day, n):
+        rows = [(u, 25.0, int(rng.integers(500, 9000)), 7.0, 2200, int(rng.integers(60, 130)), 3.0, 120,
+                 f"2025-01-{day:02d}") for day in range(first_day, first_day + n) for u in range(1, 31)]
+        db_operations.bulk_import_fitness(pd.DataFrame(rows, columns=["user_id", "bmi", "steps", "sleep", "calories",
+                                                                      "heart_rate", "exercise", "bp", "date"]))
+
+    model_dir, versions_dir = tmp_path / "deployed", str(tmp_path / "versions")
+    model_dir.mkdir()
+    grid = {"max_depth": [4, 8]}
+    try:
+        add_days(1, 10)
+        conn = db_operations.get_connection()
+        # Default: real seed labels only, nothing deployed.
+        seed_only = train.train(conn, n_jobs=1, promote_to=str(model_dir), versions_dir=versions_dir,
+                                param_grid=grid)
+        assert seed_only["rows"] == {"seed": 800, "rules": 0} and not seed_only["promoted"]
+        assert 0 <= seed_only["seed_holdout_accuracy"] <= 1 and os.listdir(model_dir) == []
+
+        first = train.train(conn, full=True, n_jobs=1, include_seed=False, rule_labels=True, promote_to=str(model_dir),
+                            promote_result=True, versions_dir=versions_dir, param_grid=grid, chunk_rows=70)
+        assert first["mode"] == "full" and first["rows"] == {"seed": 0, "rules": 300}
+        assert first["last_fitness_id"] == 300 and first["params"]["max_depth"] in (4, 8)
+        assert first["promoted"] and first["deployed_seed_holdout_accuracy"] is None
+
+        assert train.train(conn, rule_labels=True, versions_dir=versions_dir)["skipped"]
+
+        add_days(11, 5)
+        second = train.train(conn, n_jobs=1, rule_labels=True, promote_to=str(model_dir), promote_result=True,
+                             versions_dir=versions_dir)
+        assert second["mode"] == "warm" and second["parent"] == first["version"]
+        assert second["rows"]["rules"] == 150 and second["n_estimators"] == 200 + train.WARM_START_TREES
+        assert second["deployed_seed_holdout_accuracy"] == first["seed_holdout_accuracy"]
+        assert second["promoted"] == (second["seed_holdout_accuracy"] >= first["seed_holdout_accuracy"])
+
+        # A version that scores worse on the seed holdout than the deployed one is kept out.
+        monkeypatch.setattr(train, "deployed_seed_holdout_accuracy", lambda model_dir=None: 1.01)
+        third = train.train(conn, n_jobs=1, full=True, promote_to=str(model_dir), promote_result=True,
+                            versions_dir=versions_dir, param_grid=grid)
+        assert not third["promoted"]
+    finally:
+        db_operations.close_connection()
+
+    assert len(os.listdir(versions_dir)) == 4
+    deployed_version = second["version"] if second["promoted"] else first["version"]
+    deployed = fresh_registry.load_risk_model(str(model_dir))
+    assert deployed.model.n_jobs is None
+    with open(model_dir / train.PROMOTED_METRICS_FILE) as f:
+        assert json.load(f)["version"] == deployed_version
@@ -1,19 +1,30 @@
-def show_charts():
+def show_charts(doctor_user_id):
     import streamlit as st
     import plotly.express as px
-    import pandas as pd
-    data = {
-        "date": ["2025-10-21", "2025-10-22", "2025-10-23", "2025-10-24", "2025-10-25"],
-        "steps": [4500, 5200, 6100, 5800, 7000],
-        "calories_burned": [1800, 1950, 2100, 2000, 2200],
-        "calories_intake": [2000, 2050, 1900, 2100, 2150],
-        "medication_compliance": [1, 0.8, 1, 0.9, 1],
-    }
-    df = pd.DataFrame(data)
-    st.header("Health Analytics")
-    fig1 = px.line(df, x="date", y="steps", title="Steps Trend Over Time")
-    st.plotly_chart(fig1)
-    fig2=px.bar(df, x="date", y=["calories_intake","calories_burned"], barmode="group", title="Calories Burned vs Intake")
-    st.plotly_chart(fig2)
-    fig3 = px.bar(df, x="date", y="medication_compliance", title="Medication Compliance", color="medication_compliance")
-    st.plotly_chart(fig3)
\ No newline at end of file
+    from agents.cohort_analytics import COHORT_METRICS, cohort_analytics
+
+    window = st.selectbox("Window", [7, 30, 90, 365], index=1, format_func=lambda d: f"Last {d} days")
+    cohort = cohort_analytics(doctor_user_id, window_days=window)
+    patients = cohort["patients"]
+    if patients.empty:
+        st.info("You have no assigned patients.")
+        return
+
+    cols = st.columns(len(cohort["risk_counts"]))
+    for col, (level, count) in zip(cols, cohort["risk_counts"].items()):
+        col.metric(f"{level} risk" if level in ("High", "Medium", "Low") else level, count)
+
+    st.subheader("Triage")
+    triage_columns = ["name", "risk_level", "outliers", "days"] + [f"{m}_mean" for m in COHORT_METRICS] + ["latest_date"]
+    st.dataframe(patients[triage_columns], hide_index=True, use_container_width=True)
+
+    st.subheader("Panel distribution")
+    st.dataframe(cohort["distribution"].round(1), use_container_width=True)
+    metric = st.selectbox("Metric", list(COHORT_METRICS))
+    fig = px.histogram(patients, x=f"{metric}_mean", color="risk_level", nbins=30,
+                       title=f"Average {metric} per patient")
+    st.plotly_chart(fig)
+
+    if not cohort["outliers"].empty:
+        st.subheader("Outliers")
+        st.dataframe(cohort["outliers"], hide_index=True, use_container_width=True)
@@ -1,44 +1,43 @@
 # ui/csv_upload.py
+import os
+import tempfile
+
 import streamlit as st
 import pandas as pd
-from scripts.db_operations import add_fitness_data
+from scripts.csv_import import import_fitness_csv
 
 def show_csv_upload_ui():
     st.header("📤 Upload Fitness CSV")
     uploaded = st.file_uploader("Choose CSV file", type=["csv"])
 
     if uploaded is not None:
-        df = pd.read_csv(uploaded)
+        # Only the first rows are parsed for the preview; the import streams the rest.
+        df = pd.read_csv(uploaded, nrows=5)
+        uploaded.seek(0)
         st.write("Preview:")
-        st.dataframe(df.head())
+        st.dataframe(df)
 
         if st.button("Import to DB"):
-
-            for _, row in df.iterrows():
-
-                uid = int(row.get("user_id", st.session_state.get("user_id", 1)))
-                date = str(row.get("date", "2025-01-01"))
-                steps = int(row.get("steps", 0))
-                calories = int(row.get("calories", 0))
-                hr = int(row.get("heart_rate", 0))
-
-                # CSV may not contain these → give safe defaults
-                bmi = float(row.get("bmi", 0.0))
-                sleep = float(row.get("sleep", 0.0))
-                exercise = float(row.get("exercise", 0.0))
-                bp = int(row.get("bp", 0))
-
-                # MUST pass all 9 arguments in correct order
-                add_fitness_data(
-                    uid,
-                    bmi,
-                    steps,
-                    sleep,
-                    calories,
-                    hr,
-                    exercise,
-                    bp,
-                    date
-                )
-
-            st.success("Imported CSV to DB.")
+            progress = st.progress(0.0, text="Importing...")
+
+            def on_progress(fraction, counts):
+                progress.progress(fraction, text=f"Imported {counts['inserted']} of {counts['rows']} rows read")
+
+            # Rows without user_id belong to the logged-in user; missing metric
+            # columns default to 0. Bad rows go to a reject file instead of
+            # stopping the import.
+            reject_path = os.path.join(tempfile.gettempdir(), f"fitness_rejects_{st.session_state.get('user_id', 1)}.csv")
+            result = import_fitness_csv(
+                uploaded,
+                default_user_id=st.session_state.get("user_id", 1),
+                reject_path=reject_path,
+                on_progress=on_progress,
+            )
+
+            st.success(
+                f"Imported CSV to DB: {result['inserted']} inserted, "
+                f"{result['duplicates']} duplicates skipped, {result['rejected']} rejected."
+            )
+            if result["reject_path"]:
+                with open(result["reject_path"], "rb") as f:
+                    st.download_button("Download rejected rows", f, file_name="rejected_rows.csv", mime="text/csv")